@@ -0,0 +1,65 @@
+"""
+Per-update cost of the JSON codecs from :mod:`utils.codec` on the webhook path.
+
+    python -m benchmarks.codec [--repeat N] [updates.jsonl ...]
+
+Every line of the files is one update as Telegram sends it, by default benchmarks/fixtures/updates.jsonl.
+For each installed codec it reports the time to decode an update, to decode it and build
+:class:`aiogram.types.Update`, and to encode a webhook response.
+"""
+import argparse
+import os
+import time
+
+from aiogram import types
+from aiogram.dispatcher.webhook import SendMessage, SendSticker
+
+from utils.codec import CODECS, load_codec
+
+FIXTURE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures", "updates.jsonl")
+
+
+def per_call(func, items, repeat):
+    """Best time per item over ``repeat`` runs, in microseconds."""
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for item in items:
+            func(item)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best / len(items) * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("files", nargs="*", default=[FIXTURE], help="JSON lines files with updates")
+    parser.add_argument("--repeat", type=int, default=200)
+    args = parser.parse_args()
+
+    bodies = []
+    for name in args.files:
+        with open(name, "rb") as f:
+            bodies.extend(line for line in f.read().splitlines() if line.strip())
+
+    responses = [
+        SendMessage(123456789, "Слишком много желающих, попробуй ещё раз через минуту").get_response(),
+        SendSticker(123456789, "CAACAgIAAxkBAAICdWBbStbGd5tmQAEOJ2FeV-cAAZvF6gACSwADJHFiGi51uptDYQ80HgQ").get_response(),
+    ]
+
+    print(f"{len(bodies)} updates, {sum(map(len, bodies)) / len(bodies):.0f} bytes on average")
+    for name in CODECS:
+        try:
+            _, loads, dumps = load_codec(name)
+        except ImportError:
+            print(f"  {name:<8} not installed")
+            continue
+
+        decode = per_call(loads, bodies, args.repeat)
+        parse = per_call(lambda body: types.Update.to_object(loads(body)), bodies, args.repeat)
+        encode = per_call(dumps, responses, args.repeat * 10)
+        print(f"  {name:<8} decode {decode:7.1f} us  decode + Update {parse:7.1f} us  encode response {encode:6.2f} us")
+
+
+if __name__ == "__main__":
+    main()
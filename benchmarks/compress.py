@@ -0,0 +1,163 @@
+"""
+Compares sticker serialization paths: time and peak traced memory per sticker.
+
+    python -m benchmarks.compress [--repeat N] [--shapes N] [file.tgs ...]
+
+Without files a large synthetic sticker is generated.
+"""
+import argparse
+import codecs
+import gzip
+import io
+import json
+import random
+import time
+import tracemalloc
+
+from stickers.encoder import dump_tgs, tg_compress
+
+
+def legacy_tg_compress(d):
+    """``tg_compress`` as it was before the iterative rewrite."""
+    my_list = d.items() if isinstance(d, dict) else enumerate(d)
+
+    for k, v in my_list:
+        if isinstance(v, dict) or isinstance(v, list):
+            if all([q == [0, 0] for q in d]):
+                d = []
+            else:
+                legacy_tg_compress(v)
+        else:
+            if isinstance(v, float):
+                d[k] = round(v, 2)
+
+
+def legacy_path(d):
+    legacy_tg_compress(d)
+    output = io.BytesIO()
+    with gzip.open(output, "w") as g:
+        json.dump(d, codecs.getwriter("utf-8")(g), separators=(",", ":"), ensure_ascii=False)
+    return output.getvalue()
+
+
+def iterative_path(d):
+    tg_compress(d)
+    output = io.BytesIO()
+    with gzip.open(output, "w") as g:
+        json.dump(d, codecs.getwriter("utf-8")(g), separators=(",", ":"), ensure_ascii=False)
+    return output.getvalue()
+
+
+def fused_path(d):
+    output = io.BytesIO()
+    with gzip.open(output, "w") as g:
+        dump_tgs(d, g)
+    return output.getvalue()
+
+
+PATHS = (
+    ("legacy tg_compress + json.dump", legacy_path),
+    ("iterative tg_compress + json.dump", iterative_path),
+    ("fused dump_tgs", fused_path),
+)
+
+
+def synthetic_sticker(shapes: int, seed: int = 0) -> dict:
+    """Lottie-shaped dict: animated bezier groups, like text layers produced by ``TextPrinter``."""
+    rnd = random.Random(seed)
+
+    def point():
+        return [rnd.uniform(-512, 512), rnd.uniform(-512, 512)]
+
+    def keyframes(n):
+        return [
+            {"t": float(i * 6), "s": point(), "e": point(), "i": {"x": [0.5], "y": [0.5]}, "o": {"x": [0.5], "y": [0.5]}}
+            for i in range(n)
+        ]
+
+    def path(n):
+        return {
+            "ty": "sh",
+            "ks": {
+                "a": 0,
+                "k": {
+                    "c": True,
+                    "i": [[0.0, 0.0] if rnd.random() < 0.5 else point() for _ in range(n)],
+                    "o": [[0.0, 0.0] if rnd.random() < 0.5 else point() for _ in range(n)],
+                    "v": [point() for _ in range(n)],
+                },
+            },
+        }
+
+    groups = [
+        {
+            "ty": "gr",
+            "it": [path(rnd.randint(4, 24)) for _ in range(3)]
+            + [{"ty": "tr", "p": {"a": 1, "k": keyframes(30)}, "a": {"a": 0, "k": [0.0, 0.0]}}],
+        }
+        for _ in range(shapes)
+    ]
+    return {
+        "v": "5.5.2",
+        "fr": 60.0,
+        "ip": 0.0,
+        "op": 180.0,
+        "w": 512,
+        "h": 512,
+        "ddd": 0,
+        "layers": [{"ty": 4, "ind": 0, "ip": 0.0, "op": 180.0, "shapes": groups}],
+    }
+
+
+def measure(func, source: str, repeat: int):
+    best = None
+    for _ in range(repeat):
+        # every path gets a fresh dict, the legacy ones modify it in place
+        d = json.loads(source)
+        start = time.perf_counter()
+        func(d)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+
+    d = json.loads(source)
+    tracemalloc.start()
+    output = func(d)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return best, peak, output
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("files", nargs="*", help=".tgs or lottie JSON files")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--shapes", type=int, default=400, help="groups in the synthetic sticker")
+    args = parser.parse_args()
+
+    sources = []
+    for name in args.files:
+        with open(name, "rb") as f:
+            data = f.read()
+        if data[:2] == b"\x1f\x8b":
+            data = gzip.decompress(data)
+        sources.append((name, data.decode("utf-8")))
+    if not sources:
+        sources.append((f"synthetic ({args.shapes} groups)", json.dumps(synthetic_sticker(args.shapes))))
+
+    for name, source in sources:
+        print(f"{name}: {len(source) / 1024:.0f} KiB of JSON")
+        reference = None
+        for label, func in PATHS:
+            elapsed, peak, output = measure(func, source, args.repeat)
+            decoded = json.loads(gzip.decompress(output))
+            if reference is None:
+                reference = decoded
+            same = "same" if decoded == reference else "DIFFERENT"
+            print(
+                f"  {label:<36} {elapsed * 1000:8.1f} ms  peak {peak / 1024:8.0f} KiB  "
+                f"output {len(output) / 1024:6.1f} KiB  {same}"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,121 @@
+"""
+Generates the .tgs corpus in benchmarks/fixtures/stickers used by :mod:`benchmarks.render`.
+
+    python -m benchmarks.fixtures.make_stickers
+
+The stickers are synthetic but shaped like real ones: animated groups, bezier paths with
+shape keyframes, and a few that break the Telegram rules so ``validate_and_fix`` has work to do.
+"""
+import gzip
+import json
+import math
+import os
+import random
+
+from lottie import Color, NVector, objects
+
+from stickers.encoder import tg_compress
+
+DIRECTORY = os.path.join(os.path.dirname(os.path.abspath(__file__)), "stickers")
+
+
+def animated_group(rnd, frames, shape):
+    group = objects.Group()
+    group.add_shape(shape)
+    group.add_shape(objects.Fill(Color(rnd.random(), rnd.random(), rnd.random())))
+    for t in range(0, frames + 1, max(frames // 6, 1)):
+        group.transform.position.add_keyframe(t, NVector(rnd.uniform(0, 512), rnd.uniform(0, 512)))
+        group.transform.rotation.add_keyframe(t, rnd.uniform(-180, 180))
+    return group
+
+
+def blob(rnd, points, radius):
+    bezier = objects.Bezier()
+    for i in range(points):
+        angle = 2 * math.pi * i / points
+        r = radius * rnd.uniform(0.7, 1.3)
+        tangent = NVector(-math.sin(angle), math.cos(angle)) * (r / 3)
+        bezier.add_point(NVector(math.cos(angle) * r, math.sin(angle) * r), -tangent, tangent)
+    bezier.close()
+    return bezier
+
+
+def sticker(frame_rate, frames, size=512):
+    animation = objects.Animation(frames, frame_rate)
+    animation.width = animation.height = size
+    return animation
+
+
+def simple(rnd):
+    """One bouncing circle."""
+    animation = sticker(60, 180)
+    layer = animation.add_layer(objects.ShapeLayer())
+    layer.add_shape(animated_group(rnd, 180, objects.Ellipse(NVector(0, 0), NVector(120, 120))))
+    return animation
+
+
+def shapes(rnd):
+    """A dozen rotating and moving stars, rectangles and circles in three layers."""
+    animation = sticker(60, 180)
+    for _ in range(3):
+        layer = animation.add_layer(objects.ShapeLayer())
+        for _ in range(4):
+            shape = rnd.choice(
+                [
+                    lambda: objects.Star(),
+                    lambda: objects.Rect(NVector(0, 0), NVector(rnd.uniform(20, 120), rnd.uniform(20, 120))),
+                    lambda: objects.Ellipse(NVector(0, 0), NVector(rnd.uniform(20, 120), rnd.uniform(20, 120))),
+                ]
+            )()
+            layer.add_shape(animated_group(rnd, 180, shape))
+    return animation
+
+
+def paths(rnd):
+    """Thirty morphing bezier blobs, the heaviest JSON of the corpus."""
+    animation = sticker(30, 90)
+    layer = animation.add_layer(objects.ShapeLayer())
+    for _ in range(30):
+        path = objects.Path()
+        for t in range(0, 91, 18):
+            path.shape.add_keyframe(t, blob(rnd, 10, rnd.uniform(20, 80)))
+        layer.add_shape(animated_group(rnd, 90, path))
+    return animation
+
+
+def short(rnd):
+    """One second long, text on it can only shake."""
+    animation = sticker(30, 30)
+    layer = animation.add_layer(objects.ShapeLayer())
+    layer.add_shape(animated_group(rnd, 30, objects.Rect(NVector(0, 0), NVector(200, 200))))
+    return animation
+
+
+def invalid(rnd):
+    """25 fps, five seconds, 400x400: fixed by ``validate_and_fix``."""
+    animation = sticker(25, 125, size=400)
+    layer = animation.add_layer(objects.ShapeLayer())
+    for _ in range(5):
+        layer.add_shape(animated_group(rnd, 125, objects.Ellipse(NVector(0, 0), NVector(60, 60))))
+    return animation
+
+
+STICKERS = (simple, shapes, paths, short, invalid)
+
+
+def main():
+    os.makedirs(DIRECTORY, exist_ok=True)
+    for make in STICKERS:
+        animation = make(random.Random(make.__name__))
+        data = animation.to_dict()
+        # real stickers are exported with limited precision too
+        tg_compress(data)
+        path = os.path.join(DIRECTORY, f"{make.__name__}.tgs")
+        # mtime=0 keeps the files byte-identical between runs
+        with open(path, "wb") as f, gzip.GzipFile(fileobj=f, mode="wb", mtime=0) as g:
+            g.write(json.dumps(data, separators=(",", ":")).encode("utf-8"))
+        print(f"{path}: {os.path.getsize(path)} bytes")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,285 @@
+"""
+End-to-end load test of the webhook path, offline.
+
+    python -m benchmarks.loadtest [--updates N] [--users N] [--concurrency N] [--batch N] [--seed N]
+                                  [--api-latency MS] [--render-mode MODE] [--storage BACKEND] [updates.jsonl ...]
+
+Updates are the recorded ones from the given files (benchmarks/fixtures/updates.jsonl by default)
+followed by synthetic ones up to ``--updates``: replies with text to the fixture stickers,
+stickers and /start from ``--users`` different users, drawn with ``--seed``.
+Every update (or every ``--batch`` of them) goes through :class:`webhook.WebhookRequestHandler` the way
+``index.handler`` passes it, ``--concurrency`` invocations at a time.
+
+Bot API requests go to a fake server in a child process. It serves the fixture stickers for any ``file_id``,
+accepts uploads and answers every request after ``--api-latency`` ms. Users are kept by the ``--storage`` backend,
+SQLite in a temporary file.
+The report has the throughput, latency percentiles of the invocations, the CPU time of this process
+(fake server excluded) and its render workers, and the peak RSS.
+"""
+import argparse
+import asyncio
+import json
+import multiprocessing
+import os
+import random
+import resource
+import socket
+import tempfile
+import time
+import zlib
+
+from benchmarks.codec import FIXTURE as UPDATES
+from benchmarks.render import FIXTURES as STICKERS
+
+TOKEN = "1700000000:loadtest"
+TEXTS = (
+    "Привет",
+    "Привет, как дела?",
+    "ok",
+    "hello world, this is a longer text for three lines",
+    "Когда текст длинный, он занимает все три строки",
+    "lol",
+    "С днём рождения!",
+)
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def fake_api(port: int, latency: float) -> None:
+    """Runs the fake Bot API server, in a child process."""
+    from aiohttp import web
+
+    stickers = {}
+    for name in sorted(os.listdir(STICKERS)):
+        if name.endswith(".tgs"):
+            with open(os.path.join(STICKERS, name), "rb") as f:
+                stickers[name] = f.read()
+    names = list(stickers)
+    stats = {"requests": {}, "downloads": 0, "uploaded_bytes": 0}
+
+    def sticker_name(file_id: str) -> str:
+        # synthetic updates name the fixture, recorded ones get a stable pick
+        name = f"{file_id}.tgs"
+        return name if name in stickers else names[zlib.crc32(file_id.encode()) % len(names)]
+
+    def message(chat_id, **fields):
+        result = {"message_id": 1, "date": int(time.time()), "chat": {"id": int(chat_id), "type": "private"}}
+        result.update(fields)
+        return result
+
+    async def api(request):
+        method = request.match_info["method"].lower()
+        stats["requests"][method] = stats["requests"].get(method, 0) + 1
+        data = await request.post()
+        await asyncio.sleep(latency)
+
+        if method == "getfile":
+            file_id = data["file_id"]
+            name = sticker_name(file_id)
+            result = {"file_id": file_id, "file_unique_id": file_id, "file_size": len(stickers[name])}
+            result["file_path"] = f"stickers/{name}"
+        elif method == "sendsticker":
+            sticker = data["sticker"]
+            if hasattr(sticker, "file"):
+                stats["uploaded_bytes"] += len(sticker.file.read())
+                file_id = f"uploaded-{stats['uploaded_bytes']}"
+            else:
+                file_id = sticker
+            result = message(
+                data["chat_id"],
+                sticker={
+                    "file_id": file_id,
+                    "file_unique_id": file_id,
+                    "width": 512,
+                    "height": 512,
+                    "is_animated": True,
+                },
+            )
+        elif method == "sendmessage":
+            result = message(data["chat_id"], text=data.get("text", ""))
+        else:
+            result = True
+        return web.json_response({"ok": True, "result": result})
+
+    async def download(request):
+        stats["downloads"] += 1
+        await asyncio.sleep(latency)
+        return web.Response(body=stickers[os.path.basename(request.match_info["path"])])
+
+    async def get_stats(request):
+        return web.json_response(stats)
+
+    app = web.Application()
+    app.router.add_post("/bot{token}/{method}", api)
+    app.router.add_get("/file/bot{token}/{path:.+}", download)
+    app.router.add_get("/stats", get_stats)
+    web.run_app(app, host="127.0.0.1", port=port, print=None, handle_signals=False)
+
+
+def synthetic_updates(rnd: random.Random, count: int, users: int, first_id: int) -> list:
+    """Sticker replies (mostly), stickers and /start of ``users`` users with ids from 1."""
+    stickers = sorted(name[:-4] for name in os.listdir(STICKERS) if name.endswith(".tgs"))
+    updates = []
+    for update_id in range(first_id, first_id + count):
+        user = {"id": rnd.randint(1, users), "is_bot": False, "first_name": "Load", "language_code": "ru"}
+        message = {
+            "message_id": update_id,
+            "from": user,
+            "chat": {"id": user["id"], "type": "private"},
+            "date": 1616600000,
+        }
+        name = rnd.choice(stickers)
+        sticker = {"file_id": name, "file_unique_id": name, "width": 512, "height": 512, "is_animated": True}
+        kind = rnd.random()
+        if kind < 0.8:
+            message["text"] = rnd.choice(TEXTS)
+            message["reply_to_message"] = {
+                "message_id": update_id - 1,
+                "from": {"id": 1700000000, "is_bot": True, "first_name": "Say it"},
+                "chat": message["chat"],
+                "date": 1616600000,
+                "sticker": sticker,
+            }
+        elif kind < 0.9:
+            message["sticker"] = sticker
+        else:
+            message["text"] = "/start"
+            message["entities"] = [{"offset": 0, "length": 6, "type": "bot_command"}]
+        updates.append({"update_id": update_id, "message": message})
+    return updates
+
+
+def percentile(values: list, q: float) -> float:
+    return values[min(int(q * len(values)), len(values) - 1)]
+
+
+async def replay(bodies: list, port: int, concurrency: int) -> list:
+    """Posts every body to a webhook handler, returns the latencies in seconds."""
+    from aiogram import Dispatcher
+    from aiogram.bot.api import TelegramAPIServer
+
+    import loader
+    from handlers import register_handlers
+    from middlewares import UserMiddleware
+    from utils.models import flush_counters
+    from webhook import WebhookBot, WebhookRequestHandler
+
+    bot = WebhookBot(
+        token=TOKEN,
+        parse_mode="HTML",
+        validate_token=False,
+        server=TelegramAPIServer.from_base(f"http://127.0.0.1:{port}"),
+    )
+    dp = Dispatcher(bot=bot)
+    dp.middleware.setup(UserMiddleware())
+    await register_handlers(dp)
+    loader.render_executor.start()
+
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies = []
+
+    async def invoke(body):
+        async with semaphore:
+            started = time.perf_counter()
+            await WebhookRequestHandler(dp=dp, bot=bot).post({"body": body})
+            latencies.append(time.perf_counter() - started)
+
+    await asyncio.gather(*[invoke(body) for body in bodies])
+    await flush_counters()
+    await WebhookBot.close_shared_session()
+    loader.render_executor.shutdown()
+    return latencies
+
+
+async def server_stats(port: int) -> dict:
+    import aiohttp
+
+    async with aiohttp.ClientSession() as session:
+        async with session.get(f"http://127.0.0.1:{port}/stats") as response:
+            return await response.json()
+
+
+async def wait_for_server(port: int, timeout: float = 10) -> None:
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            await server_stats(port)
+            return
+        except OSError:
+            if time.monotonic() > deadline:
+                raise
+            await asyncio.sleep(0.05)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("files", nargs="*", default=[UPDATES], help="JSON lines files with recorded updates")
+    parser.add_argument("--updates", type=int, default=200, help="total updates, synthetic ones fill up the rest")
+    parser.add_argument("--users", type=int, default=50)
+    parser.add_argument("--concurrency", type=int, default=8, help="invocations running at the same time")
+    parser.add_argument("--batch", type=int, default=1, help="updates per invocation, as from a message queue")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--api-latency", type=float, default=20, help="fake Bot API response time, ms")
+    parser.add_argument("--render-mode", choices=("process", "thread", "inline"))
+    parser.add_argument("--storage", choices=("memory", "sqlite"), default="memory")
+    args = parser.parse_args()
+
+    if args.render_mode:
+        os.environ["STICKER_RENDER_MODE"] = args.render_mode
+    os.environ["STORAGE_BACKEND"] = args.storage
+    directory = tempfile.TemporaryDirectory()
+    os.environ["STORAGE_SQLITE_PATH"] = os.path.join(directory.name, "users.sqlite3")
+
+    updates = []
+    for name in args.files:
+        with open(name, "rb") as f:
+            updates.extend(json.loads(line) for line in f.read().splitlines() if line.strip())
+    updates = updates[: args.updates]
+    first_id = max([update["update_id"] for update in updates], default=0) + 1
+    updates += synthetic_updates(random.Random(args.seed), args.updates - len(updates), args.users, first_id)
+    bodies = [
+        json.dumps(updates[i] if args.batch == 1 else updates[i : i + args.batch])
+        for i in range(0, len(updates), args.batch)
+    ]
+
+    port = free_port()
+    server = multiprocessing.Process(target=fake_api, args=(port, args.api_latency / 1000), daemon=True)
+    server.start()
+    loop = asyncio.get_event_loop()
+    try:
+        loop.run_until_complete(wait_for_server(port))
+
+        cpu_before = resource.getrusage(resource.RUSAGE_SELF)
+        started = time.perf_counter()
+        latencies = loop.run_until_complete(replay(bodies, port, args.concurrency))
+        elapsed = time.perf_counter() - started
+        cpu_after = resource.getrusage(resource.RUSAGE_SELF)
+        # render workers are reaped by the executor shutdown, the fake server is still running
+        workers = resource.getrusage(resource.RUSAGE_CHILDREN)
+        stats = loop.run_until_complete(server_stats(port))
+    finally:
+        server.terminate()
+        server.join()
+        directory.cleanup()
+
+    latencies.sort()
+    cpu = (cpu_after.ru_utime - cpu_before.ru_utime) + (cpu_after.ru_stime - cpu_before.ru_stime)
+    print(f"{len(updates)} updates in {len(bodies)} invocations, {args.storage} storage, concurrency {args.concurrency}")
+    print(f"  throughput  {len(updates) / elapsed:8.1f} updates/s over {elapsed:.2f} s")
+    print(
+        "  latency     "
+        + "  ".join(f"p{int(q * 100)} {percentile(latencies, q) * 1000:7.1f} ms" for q in (0.5, 0.95, 0.99))
+        + f"  max {latencies[-1] * 1000:7.1f} ms"
+    )
+    print(f"  CPU         {cpu:8.2f} s handler, {workers.ru_utime + workers.ru_stime:.2f} s render workers")
+    print(f"  peak RSS    {cpu_after.ru_maxrss // 1024:8d} MiB handler, {workers.ru_maxrss // 1024} MiB largest worker")
+    requests = ", ".join(f"{method} {count}" for method, count in sorted(stats["requests"].items()))
+    print(f"  Bot API     {requests}, {stats['downloads']} downloads, {stats['uploaded_bytes'] // 1024} KiB uploaded")
+
+
+if __name__ == "__main__":
+    main()
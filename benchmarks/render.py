@@ -0,0 +1,263 @@
+"""
+Sticker rendering benchmark over the fixture corpus.
+
+    python -m benchmarks.render [--repeat N] [--fixtures NAME ...] [--animations NAME ...] [--stages NAME ...]
+                                [--save results.json] [--compare baseline.json] [--threshold 1.25]
+
+For every fixture in benchmarks/fixtures/stickers, every text and every animation in
+``DEFAULT_ANIMATIONS`` it reports the best wall time of each stage, the peak RSS while the stage runs
+and its growth over the RSS before the stage (Linux only, reset through /proc/self/clear_refs)
+and the size of its output.
+The peak RSS is that of the whole process, compare it with the function memory limit.
+Stages that do not depend on the text or the animation are measured once per fixture or text.
+Text lines are rendered from scratch, except for ``add_text_cached`` where they come from the line cache.
+
+``--save`` writes the results as JSON, ``--compare`` prints them next to a saved run
+and exits with status 1 if any stage got slower than ``--threshold`` times the baseline.
+"""
+import argparse
+import gzip
+import io
+import itertools
+import json
+import os
+import random
+import sys
+import textwrap
+import time
+
+from lottie.nvector import NVector
+
+from stickers import DEFAULT_ANIMATIONS, main as renderer_module, vectorized
+from stickers.encoder import dump_tgs, tg_compress
+from stickers.main import (
+    TextPrinter,
+    clone_animation,
+    get_font_renderer,
+    load_animation,
+    render,
+    validate_and_fix,
+    warm_up,
+)
+
+FIXTURES = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures", "stickers")
+TEXTS = {
+    "short": "ok",
+    "medium": "Привет, как дела?",
+    "long": "When the text is long enough it takes all three lines",
+}
+STAGES = (
+    "load",
+    "font_render",
+    "validate_and_fix",
+    "text_lines",
+    "to_dict",
+    "tg_compress",
+    "dump_tgs",
+    "add_text",
+    "add_text_cached",
+)
+
+
+def wrap(text: str) -> list:
+    """Splits ``text`` into lines the way the ``say`` handler does."""
+    return textwrap.fill(text, 15).split("\n")[:3]
+
+
+def _status(field: str) -> int:
+    with open("/proc/self/status") as f:
+        for line in f:
+            if line.startswith(field + ":"):
+                return int(line.split()[1])
+    raise KeyError(field)
+
+
+def peak_rss(func, args):
+    """
+    Runs ``func(*args)``, returns its result, the peak RSS of the process meanwhile and how much it grew
+    over the RSS before the call, both in KiB, None if unknown.
+    """
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            # resets the peak RSS (VmHWM) to the current RSS
+            f.write("5")
+    except OSError:
+        return func(*args), None, None
+    before = _status("VmHWM")
+    result = func(*args)
+    peak = _status("VmHWM")
+    return result, peak, peak - before
+
+
+def measure(func, setup, repeat: int) -> dict:
+    """Best time of ``func(*setup())`` over ``repeat`` runs, ``setup`` is not timed."""
+    best = None
+    for _ in range(repeat):
+        args = setup()
+        start = time.perf_counter()
+        func(*args)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+
+    output, rss, rss_growth = peak_rss(func, setup())
+    return {
+        "time_ms": best * 1000,
+        "rss_kib": rss,
+        "rss_growth_kib": rss_growth,
+        "size": len(output) if isinstance(output, (bytes, str)) else None,
+    }
+
+
+def gzip_tgs(d) -> bytes:
+    output = io.BytesIO()
+    with gzip.open(output, "w") as g:
+        dump_tgs(d, g)
+    return output.getvalue()
+
+
+def text_lines(printer, lines):
+    return [printer.create_text_line(line) for line in lines]
+
+
+def with_text(animation, lines, selected_animation):
+    """Copy of ``animation`` with the text layer added, as :meth:`TextPrinter.add_text` builds it."""
+    import lottie
+
+    printer = TextPrinter(clone_animation(animation), selected_animation)
+    layer = lottie.objects.ShapeLayer()
+    printer.tg_sticker.insert_layer(0, layer)
+    for shape in text_lines(printer, lines):
+        layer.add_shape(shape)
+    validate_and_fix(printer.tg_sticker)
+    return printer.tg_sticker
+
+
+def render_lines(renderer, lines):
+    return [renderer.render(line, size=64, pos=NVector(0, 0)) for line in lines]
+
+
+def font_cases(stages):
+    """Yields ``(key, func, setup)`` of the stages that do not depend on the sticker."""
+    if "font_render" in stages:
+        renderer = get_font_renderer()
+        for text_name, text in TEXTS.items():
+            yield ("-", text_name, "-", "font_render"), render_lines, lambda lines=wrap(text): (renderer, lines)
+
+
+def sticker_cases(fixture: str, data: bytes, stages, animations):
+    """Yields ``(key, func, setup)`` of every measured stage for one fixture."""
+    animation, _ = load_animation(io.BytesIO(data))
+
+    if "load" in stages:
+        yield (fixture, "-", "-", "load"), load_animation, lambda: (io.BytesIO(data),)
+    if "validate_and_fix" in stages:
+        yield (fixture, "-", "-", "validate_and_fix"), validate_and_fix, lambda: (clone_animation(animation),)
+
+    for text_name, text in TEXTS.items():
+        lines = wrap(text)
+        for selected in animations:
+            key = (fixture, text_name, selected)
+
+            def printer(lines=lines, selected=selected):
+                renderer_module._text_lines.clear()
+                return TextPrinter(clone_animation(animation), selected), lines
+
+            def built(lines=lines, selected=selected):
+                renderer_module._text_lines.clear()
+                return (with_text(animation, lines, selected),)
+
+            def built_dict(lines=lines, selected=selected):
+                renderer_module._text_lines.clear()
+                return (with_text(animation, lines, selected).to_dict(),)
+
+            def source(lines=lines, selected=selected):
+                renderer_module._text_lines.clear()
+                return clone_animation(animation), lines, selected
+
+            def source_cached(lines=lines, selected=selected):
+                # the same lines were rendered on another sticker before
+                render(clone_animation(animation), lines, selected)
+                return clone_animation(animation), lines, selected
+
+            stage_cases = (
+                ("text_lines", text_lines, printer),
+                ("to_dict", lambda an: an.to_dict(), built),
+                ("tg_compress", tg_compress, built_dict),
+                ("dump_tgs", gzip_tgs, built_dict),
+                ("add_text", render, source),
+                ("add_text_cached", render, source_cached),
+            )
+            for stage, func, setup in stage_cases:
+                if stage in stages:
+                    yield key + (stage,), func, setup
+
+
+def compare(results: dict, baseline: dict, threshold: float) -> bool:
+    """Prints results against the baseline, returns True if no stage is slower than ``threshold`` times."""
+    ok = True
+    for key, result in results.items():
+        base = baseline.get(key)
+        if base is None:
+            continue
+        ratio = result["time_ms"] / base["time_ms"] if base["time_ms"] else 1.0
+        mark = ""
+        if ratio > threshold:
+            mark = "  SLOWER"
+            ok = False
+        elif ratio < 1 / threshold:
+            mark = "  faster"
+        size = ""
+        if result["size"] is not None and base["size"]:
+            size = f"  size {result['size'] / base['size']:5.2f}x"
+        print(f"  {key:<48} {base['time_ms']:9.2f} -> {result['time_ms']:9.2f} ms  {ratio:5.2f}x{size}{mark}")
+    return ok
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--fixtures", nargs="*", help="fixture names without .tgs, all by default")
+    parser.add_argument("--animations", nargs="*", default=list(DEFAULT_ANIMATIONS), choices=DEFAULT_ANIMATIONS)
+    parser.add_argument("--stages", nargs="*", default=list(STAGES), choices=STAGES)
+    parser.add_argument("--save", help="write the results to this JSON file")
+    parser.add_argument("--compare", help="JSON file saved by an earlier run with --save")
+    parser.add_argument("--threshold", type=float, default=1.25, help="slowdown that fails --compare")
+    args = parser.parse_args()
+
+    names = args.fixtures or sorted(name[:-4] for name in os.listdir(FIXTURES) if name.endswith(".tgs"))
+    print(f"NumPy path {'enabled' if vectorized.ENABLED else 'disabled'}, best of {args.repeat}")
+
+    # the font is loaded once per worker in production, keep it out of the numbers
+    warm_up()
+    random.seed(0)
+    if vectorized.np is not None:
+        vectorized.np.random.seed(0)
+
+    results = {}
+    print(f"  {'fixture/text/animation/stage':<48} {'time':>9}     {'peak RSS':>9}   {'growth':>10}  {'output':>11}")
+    all_cases = [font_cases(args.stages)]
+    for name in names:
+        with open(os.path.join(FIXTURES, f"{name}.tgs"), "rb") as f:
+            all_cases.append(sticker_cases(name, f.read(), args.stages, args.animations))
+
+    for key, func, setup in itertools.chain.from_iterable(all_cases):
+        result = results["/".join(key)] = measure(func, setup, args.repeat)
+        rss = "-" if result["rss_kib"] is None else f"{result['rss_kib']:6d} KiB"
+        growth = "-" if result["rss_growth_kib"] is None else f"{result['rss_growth_kib']:6d} KiB"
+        size = "" if result["size"] is None else f"{result['size'] / 1024:7.1f} KiB"
+        print(f"  {'/'.join(key):<48} {result['time_ms']:9.2f} ms  {rss:>10}  {growth:>10}  {size:>11}")
+
+    if args.save:
+        with open(args.save, "w") as f:
+            json.dump(results, f, indent=1, sort_keys=True)
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        print(f"Compared to {args.compare}:")
+        if not compare(results, baseline, args.threshold):
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,90 @@
+"""
+Latency of the user operations on every storage backend.
+
+    python -m benchmarks.storage [--backends NAME ...] [--users N] [--batch N] [--concurrency N]
+
+For each backend it creates ``--users`` users, reads them back, increments their counters one by one
+and in batches of ``--batch`` users, ``--concurrency`` operations at a time, and reports the latency percentiles
+of every operation. SQLite works in a temporary file, ``ydb`` needs the usual ``DB_*`` and ``YC_*``
+environment and writes to the ``benchmark`` directory of the database.
+"""
+import argparse
+import asyncio
+import os
+import tempfile
+import time
+import uuid
+
+from utils.storage import BACKENDS, MemoryStorage, SqliteStorage, Storage
+
+
+def percentile(values: list, q: float) -> float:
+    return values[min(int(q * len(values)), len(values) - 1)]
+
+
+async def timed_calls(calls: list, concurrency: int) -> list:
+    """Awaits the coroutine functions in ``calls``, returns their sorted latencies in seconds."""
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies = []
+
+    async def call(func):
+        async with semaphore:
+            started = time.perf_counter()
+            await func()
+            latencies.append(time.perf_counter() - started)
+
+    await asyncio.gather(*[call(func) for func in calls])
+    return sorted(latencies)
+
+
+async def run(storage, users: int, batch: int, concurrency: int) -> dict:
+    # ids that are not there yet, the YDB table may be left from an earlier run
+    first = int(time.time() * 1000) * 1000
+    ids = range(first, first + users)
+    operations = (
+        ("get_or_create_user", [lambda i=i: storage.get_or_create_user(i, "bench", "ru", "", 0) for i in ids]),
+        ("get_user", [lambda i=i: storage.get_user(i) for i in ids]),
+        ("add_stickers x1", [lambda i=i: storage.add_stickers({i: 1}, uuid.uuid4().hex) for i in ids]),
+        (
+            f"add_stickers x{batch}",
+            [
+                lambda chunk=ids[i : i + batch]: storage.add_stickers(
+                    {user_id: 1 for user_id in chunk}, uuid.uuid4().hex
+                )
+                for i in range(0, users, batch)
+            ],
+        ),
+    )
+    return {name: await timed_calls(calls, concurrency) for name, calls in operations}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--backends", nargs="*", default=["memory", "sqlite"], choices=BACKENDS)
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument("--batch", type=int, default=100)
+    parser.add_argument("--concurrency", type=int, default=4)
+    args = parser.parse_args()
+
+    loop = asyncio.get_event_loop()
+    with tempfile.TemporaryDirectory() as directory:
+        for backend in args.backends:
+            if backend == "memory":
+                storage = MemoryStorage()
+            elif backend == "sqlite":
+                storage = SqliteStorage(os.path.join(directory, "users.sqlite3"))
+            else:
+                storage = Storage(path="benchmark")
+                loop.run_until_complete(storage.get_user(0))
+
+            print(f"{backend}, {args.users} users, concurrency {args.concurrency}")
+            results = loop.run_until_complete(run(storage, args.users, args.batch, args.concurrency))
+            for name, latencies in results.items():
+                print(
+                    f"  {name:<20} "
+                    + "  ".join(f"p{int(q * 100)} {percentile(latencies, q) * 1e6:9.1f} us" for q in (0.5, 0.95, 0.99))
+                )
+
+
+if __name__ == "__main__":
+    main()
@@ -1,15 +1,24 @@
 import logging
+import weakref
 
 from aiogram import Dispatcher, filters
 from aiogram.types import ContentType
 
 import handlers.users as users
 
+# dispatchers the handlers are already registered in
+_registered = weakref.WeakSet()
+
 
 async def register_handlers(dp: Dispatcher):
+    """Registers the bot handlers in ``dp``, calling it again for the same dispatcher does nothing."""
+    if dp in _registered:
+        return
+
     dp.register_message_handler(users.commands.start, commands=["start"])
     dp.register_message_handler(users.commands.bot_help, commands=["help"])
     dp.register_message_handler(users.attachments.sticker, content_types=ContentType.STICKER)
     dp.register_message_handler(users.messages.say, filters.IsReplyFilter)
+    _registered.add(dp)
 
-    logging.debug("Handlers are registered.")
+    logging.debug(f"Handlers are registered: {len(dp.message_handlers.handlers)} message handlers.")
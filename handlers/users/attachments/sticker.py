@@ -1,12 +1,11 @@
-from aiogram.dispatcher.webhook import DeleteMessage
+from aiogram.dispatcher.webhook import DeleteMessage, SendMessage
 from aiogram import types
 from aiogram.types.force_reply import ForceReply
 
 
 async def sticker(message: types.Message):
     if not message.sticker.is_animated:
-        await message.answer("Нужен анимированный стикер =(")
-        return
+        return SendMessage(message.chat.id, "Нужен анимированный стикер =(")
 
     await message.answer_sticker(
         sticker=message.sticker.file_id,
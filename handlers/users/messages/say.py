@@ -1,9 +1,21 @@
 import io
+import logging
 import textwrap
+import zlib
 from utils.models.users import Users
 from aiogram import types
 from aiogram.dispatcher.handler import SkipHandler
-from stickers import TextPrinter
+from aiogram.dispatcher.webhook import SendMessage, SendSticker
+from stickers import DEFAULT_ANIMATIONS, RenderBusy, StickerTooLarge, TgsStream
+from utils import tracing
+
+BROKEN_STICKER = "Не получается прочитать этот стикер =("
+
+
+def select_animation(file_unique_id: str, lines: list) -> str:
+    """Picks one of the animations for the sticker and its text, always the same one for them."""
+    seed = zlib.crc32("\n".join([file_unique_id] + lines).encode("utf-8"))
+    return DEFAULT_ANIMATIONS[seed % len(DEFAULT_ANIMATIONS)]
 
 
 async def say(message: types.Message, user: Users):
@@ -14,23 +26,61 @@ async def say(message: types.Message, user: Users):
     ):
         raise SkipHandler
 
-    f = io.BytesIO()
+    from loader import render_executor, source_cache, sticker_cache
+
+    source = message.reply_to_message.sticker
+    list_texts = textwrap.fill(message.text, 15).split("\n")[:3]
+    # the same sticker and text get the same animation, so a repeated request is found in the cache
+    selected_animation = select_animation(source.file_unique_id, list_texts)
+    cache_key = sticker_cache.make_key(source.file_unique_id, list_texts, selected_animation)
 
-    await message.reply_to_message.sticker.download(f)
-    tp = TextPrinter(f)
+    file_id = await sticker_cache.get_file_id(cache_key, message.bot.id)
+    if file_id is not None:
+        # already uploaded, the webhook reply sends it without an API request
+        response = SendSticker(message.from_user.id, file_id)
+        # counted only once the reply is delivered, see WebhookRequestHandler.response_sent
+        response.on_sent = user.stickers_count_incr
+        return response
 
-    list_texts = textwrap.fill(message.text, 15).split("\n")
+    output = await sticker_cache.get(cache_key)
+    if output is None:
+        data = source_cache.get(source.file_unique_id)
+        if data is None:
+            # decompressed while it is downloaded, only the sticker JSON is kept
+            stream = TgsStream()
+            try:
+                stream.expect(source.file_size)
+                with tracing.span("sticker.download"):
+                    await source.download(stream, seek=False)
+                data = stream.getvalue()
+            except StickerTooLarge as e:
+                logging.warning(e)
+                return SendMessage(message.from_user.id, "Этот стикер слишком большой =(")
+            except (ValueError, zlib.error) as e:
+                # truncated or corrupt gzip
+                logging.warning(e)
+                return SendMessage(message.from_user.id, BROKEN_STICKER)
+            source_cache.put(source.file_unique_id, data, weight=len(data))
 
-    if len(list_texts) == 1:
-        output = tp.add_text(top_line=list_texts[0])
-    if len(list_texts) == 2:
-        output = tp.add_text(top_line=list_texts[0], bottom_line=list_texts[1])
-    if len(list_texts) >= 3:
-        output = tp.add_text(top_line=list_texts[0], middle_line=list_texts[1], bottom_line=list_texts[2])
+        try:
+            with tracing.span("sticker.render"):
+                output = await render_executor.render(source.file_unique_id, data, list_texts, selected_animation)
+        except RenderBusy as e:
+            logging.warning(e)
+            return SendMessage(message.from_user.id, "Слишком много желающих, попробуй ещё раз через минуту")
+        except ValueError as e:
+            # the sticker is not valid JSON (json.JSONDecodeError is a ValueError)
+            logging.warning(e)
+            return SendMessage(message.from_user.id, BROKEN_STICKER)
+        sticker_cache.put(cache_key, output)
 
-    await message.bot.send_sticker(
-        message.from_user.id,
-        types.InputFile(output, filename=".".join([message.reply_to_message.sticker.file_unique_id, "tgs"])),
-    )
+    with tracing.span("sticker.upload"):
+        sent = await message.bot.send_sticker(
+            message.from_user.id,
+            types.InputFile(io.BytesIO(output), filename=".".join([source.file_unique_id, "tgs"])),
+        )
+    if sent.sticker is not None:
+        sticker_cache.put_file_id(cache_key, message.bot.id, sent.sticker.file_id)
 
-    user.stickers_count_incr()
+    with tracing.span("user.stickers_count"):
+        await user.stickers_count_incr()
@@ -1,31 +1,76 @@
+import asyncio
+import hmac
 import logging
 import os
 
-from aiogram import Bot, Dispatcher
-from aiogram.contrib.middlewares.logging import LoggingMiddleware
+from utils.startup import report, timed
 
-from webhook import WebhookRequestHandler
-from handlers import register_handlers
-from middlewares import UserMiddleware
+with timed("import aiogram"):
+    from aiogram import Dispatcher
+    from aiogram.contrib.middlewares.logging import LoggingMiddleware
+
+with timed("import handlers"):
+    from webhook import WebhookBot, WebhookRequestHandler
+    from handlers import register_handlers
+    from middlewares import UserMiddleware
+    from utils import tracing
+    from utils.models import flush_counters
+    from loader import sticker_cache, storage
 
 
 logging.basicConfig(level=logging.INFO)
 
-bot = Bot(token=os.environ.get("TG_TOKEN", 0), parse_mode="HTML", validate_token=False)
+bot = WebhookBot(token=os.environ.get("TG_TOKEN", 0), parse_mode="HTML", validate_token=False)
 dp = Dispatcher(bot=bot)
+user_middleware = UserMiddleware()
 dp.middleware.setup(LoggingMiddleware())
-dp.middleware.setup(UserMiddleware())
+dp.middleware.setup(user_middleware)
+tracing.metrics.register("user_cache", user_middleware.stats)
+tracing.metrics.register("storage", storage.stats)
+# the database connects on the first query. DB_PREWARM=1 creates the pool sessions at import instead,
+# in the background while the rest of the cold start goes on, even if no update of the instance needs them
+if os.environ.get("DB_PREWARM", "0") not in ("", "0"):
+    storage.start()
+
+
+def metrics_authorized(event) -> bool:
+    """The metrics are only served with ``Authorization: Bearer $METRICS_TOKEN``, not at all without the setting."""
+    token = os.environ.get("METRICS_TOKEN")
+    if not token:
+        return False
+    headers = {name.lower(): value for name, value in (event.get("headers") or {}).items()}
+    return hmac.compare_digest(headers.get("authorization", ""), f"Bearer {token}")
 
 
 async def handler(event, context):
     """Yandex.Cloud functions handler."""
     if event.get("httpMethod") == "POST":
         token = event.get("params", {}).get("token")
-        try:
-            with dp.bot.with_token(token, validate_token=True):
-                await register_handlers(dp=dp)
-                return await WebhookRequestHandler(dp=dp).post(event)
-        except Exception as e:
-            logging.error(e)
-        return {"statusCode": 200, "body": "ok"}
-    return {"statusCode": 405}
+    elif "messages" in event:
+        # message queue trigger, the updates are for the default bot
+        token = None
+    elif event.get("httpMethod") == "GET" and event.get("path", "").endswith("/metrics"):
+        # stage timings of this instance only, see utils.tracing
+        if not metrics_authorized(event):
+            return {"statusCode": 404}
+        return {
+            "statusCode": 200,
+            "headers": {"Content-Type": "text/plain; version=0.0.4"},
+            "body": tracing.prometheus_text(),
+        }
+    else:
+        return {"statusCode": 405}
+
+    try:
+        # bots and their HTTP connections are kept between invocations
+        update_bot = WebhookBot.for_token(token, parse_mode="HTML") if token else bot
+        await register_handlers(dp=dp)
+        return await WebhookRequestHandler(dp=dp, bot=update_bot).post(event)
+    except Exception as e:
+        logging.error(e)
+    finally:
+        # the instance may be frozen after the invocation, nothing can be left for later
+        await asyncio.gather(flush_counters(), sticker_cache.flush())
+        logging.debug(f"Storage: {storage.stats()}")
+        report()
+    return {"statusCode": 200, "body": "ok"}
@@ -1,3 +1,14 @@
-from utils.storage import Storage
+import os
 
-storage = Storage(path="stickers")
+from stickers import RenderExecutor, ResultCache
+from utils.cache import LRUCache
+from utils.storage import storage_from_env
+
+storage = storage_from_env(path="stickers")
+sticker_cache = ResultCache.from_env()
+# JSON of downloaded stickers, parsed animations are cached by the render workers themselves
+source_cache = LRUCache(
+    max_size=int(os.environ.get("STICKER_DOWNLOAD_CACHE_SIZE", 64)),
+    max_weight=int(os.environ.get("STICKER_DOWNLOAD_CACHE_BYTES", 4 * 1024 * 1024)),
+)
+render_executor = RenderExecutor.from_env()
@@ -1,22 +1,52 @@
 import logging
+import os
+
 from aiogram import types
 from aiogram.dispatcher.middlewares import BaseMiddleware
+from utils import tracing
+from utils.cache import TTLCache
 from utils.models import Users
 
 logging
 
 
 class UserMiddleware(BaseMiddleware):
-    def __init__(self):
+    """
+    Loads the sender of every message into ``data["user"]``.
+
+    Loaded users are kept for ``ttl`` seconds, so a burst of messages from one user costs a single lookup.
+    The cached object is the one handed to the handlers, changes they make through its methods
+    (e.g. :meth:`Users.stickers_count_incr`) are written to the database and seen by the next message as well.
+    """
+
+    def __init__(self, max_size: int = None, ttl: float = None):
         super(UserMiddleware, self).__init__()
+        self.users = TTLCache(
+            max_size=max_size or int(os.environ.get("USER_CACHE_SIZE", 1024)),
+            ttl=ttl if ttl is not None else float(os.environ.get("USER_CACHE_TTL", 60)),
+        )
+
+    def invalidate(self, user_id: int) -> None:
+        """Forgets a user, the next message reads them from the database again."""
+        self.users.pop(user_id)
+
+    def clear(self) -> None:
+        self.users.clear()
+
+    def stats(self) -> dict:
+        return self.users.stats()
 
     async def on_pre_process_message(self, message: types.Message, data: dict):
         if message and message.from_user:
-            current_user = Users(
-                user_id=message.from_user.id,
-                username=message.from_user.username,
-                lang="ru" if message.from_user.locale.language.lower() == "ru" else "en",
-                refferal=message.get_args(),
-            )
+            with tracing.span("user.lookup"):
+                current_user = self.users.get(message.from_user.id)
+                if current_user is None:
+                    current_user = await Users.load(
+                        user_id=message.from_user.id,
+                        username=message.from_user.username,
+                        lang="ru" if message.from_user.locale.language.lower() == "ru" else "en",
+                        refferal=message.get_args(),
+                    )
+                    self.users.put(message.from_user.id, current_user)
             data["user"] = current_user
             logging.warning(current_user.username)
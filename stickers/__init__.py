@@ -1,5 +1,38 @@
-from stickers.main import TextPrinter
+"""
+Animated text stickers.
+
+The renderer (:mod:`stickers.main`) pulls in lottie and fontTools, which are slow to import.
+It is only imported when one of its names is accessed, or by the render workers,
+so updates that never render a sticker do not pay for it.
+"""
+# animations TextPrinter picks from, defined here to choose one without importing the renderer
+DEFAULT_ANIMATIONS = ("shake", "spring_pull_top", "spring_pull_right")
+
+from stickers.cache import AnimationCache, ResultCache  # noqa: E402
+from stickers.download import StickerTooLarge, TgsStream  # noqa: E402
+from stickers.executor import RenderBusy, RenderExecutor  # noqa: E402
+
+_RENDERER_NAMES = ("TextPrinter", "clone_animation", "load_animation", "render")
+
+
+def __getattr__(name):
+    if name in _RENDERER_NAMES:
+        from stickers import main
+
+        return getattr(main, name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
 
 __all__ = [
+    "DEFAULT_ANIMATIONS",
+    "AnimationCache",
+    "RenderBusy",
+    "RenderExecutor",
+    "ResultCache",
+    "StickerTooLarge",
     "TextPrinter",
+    "TgsStream",
+    "clone_animation",
+    "load_animation",
+    "render",
 ]
@@ -0,0 +1,174 @@
+import asyncio
+import hashlib
+import json
+import logging
+import os
+
+from utils.cache import LRUCache
+
+
+class DiskTier(object):
+    """Persistent cache tier keeping every entry in its own file inside ``directory``."""
+
+    def __init__(self, directory: str) -> None:
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    def get(self, name: str):
+        try:
+            with open(os.path.join(self.directory, name), "rb") as f:
+                return f.read()
+        except FileNotFoundError:
+            return None
+
+    def put(self, name: str, data: bytes) -> None:
+        path = os.path.join(self.directory, name)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+
+
+class ObjectStorageTier(object):
+    """Persistent cache tier on top of an S3 compatible bucket (Yandex Object Storage by default)."""
+
+    def __init__(self, bucket: str, prefix: str = "stickers/", endpoint: str = None) -> None:
+        import boto3
+
+        self.bucket = bucket
+        self.prefix = prefix
+        self._client = boto3.session.Session().client(
+            service_name="s3",
+            endpoint_url=endpoint or os.environ.get("STICKER_CACHE_ENDPOINT", "https://storage.yandexcloud.net"),
+        )
+
+    def get(self, name: str):
+        try:
+            return self._client.get_object(Bucket=self.bucket, Key=self.prefix + name)["Body"].read()
+        except self._client.exceptions.NoSuchKey:
+            return None
+
+    def put(self, name: str, data: bytes) -> None:
+        self._client.put_object(Bucket=self.bucket, Key=self.prefix + name, Body=data)
+
+
+class ResultCache(object):
+    """
+    Cache of finished .tgs stickers.
+
+    Entries are addressed by the source sticker, the wrapped text lines and the selected animation.
+    Besides the rendered bytes it remembers the ``file_id`` Telegram assigned to the uploaded sticker,
+    so a repeated request can be answered by id without uploading anything.
+    Rendered bytes live in an in-memory LRU and, if configured, in a persistent tier.
+    The persistent tier blocks, it is read in a thread and written in the background: :meth:`flush`
+    waits for the writes, call it before the invocation ends.
+    """
+
+    def __init__(self, max_size: int = 64, max_bytes: int = 16 * 1024 * 1024, persistent=None) -> None:
+        self._stickers = LRUCache(max_size=max_size, max_weight=max_bytes)
+        self._file_ids = LRUCache(max_size=max_size * 16)
+        self.persistent = persistent
+        self._writes = set()
+
+    @classmethod
+    def from_env(cls):
+        persistent = None
+        if os.environ.get("STICKER_CACHE_BUCKET"):
+            persistent = ObjectStorageTier(os.environ["STICKER_CACHE_BUCKET"])
+        elif os.environ.get("STICKER_CACHE_DIR"):
+            persistent = DiskTier(os.environ["STICKER_CACHE_DIR"])
+
+        return cls(
+            max_size=int(os.environ.get("STICKER_CACHE_SIZE", 64)),
+            max_bytes=int(os.environ.get("STICKER_CACHE_BYTES", 16 * 1024 * 1024)),
+            persistent=persistent,
+        )
+
+    @staticmethod
+    def make_key(file_unique_id: str, lines: list, selected_animation: str) -> str:
+        raw = json.dumps([file_unique_id, lines, selected_animation], ensure_ascii=False)
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    async def get(self, key: str):
+        """Returns rendered sticker bytes or None."""
+        data = self._stickers.get(key)
+        if data is None and self.persistent is not None:
+            data = await self._persistent_get(f"{key}.tgs")
+            if data is not None:
+                self._stickers.put(key, data, weight=len(data))
+        return data
+
+    def put(self, key: str, data: bytes) -> None:
+        self._stickers.put(key, data, weight=len(data))
+        if self.persistent is not None:
+            self._persistent_put(f"{key}.tgs", data)
+
+    async def get_file_id(self, key: str, bot_id: int):
+        """Returns ``file_id`` of an already uploaded sticker, file ids are only valid for the bot that got them."""
+        file_id = self._file_ids.get((key, bot_id))
+        if file_id is None and self.persistent is not None:
+            data = await self._persistent_get(f"{key}.{bot_id}.id")
+            if data is not None:
+                file_id = data.decode("utf-8")
+                self._file_ids.put((key, bot_id), file_id)
+        return file_id
+
+    def put_file_id(self, key: str, bot_id: int, file_id: str) -> None:
+        self._file_ids.put((key, bot_id), file_id)
+        if self.persistent is not None:
+            self._persistent_put(f"{key}.{bot_id}.id", file_id.encode("utf-8"))
+
+    async def flush(self) -> None:
+        """Waits for the writes to the persistent tier."""
+        if self._writes:
+            await asyncio.gather(*list(self._writes))
+
+    async def _persistent_get(self, name: str):
+        try:
+            return await asyncio.get_event_loop().run_in_executor(None, self.persistent.get, name)
+        except Exception as e:
+            logging.error(e)
+            return None
+
+    def _persistent_put(self, name: str, data: bytes) -> None:
+        write = asyncio.ensure_future(self._persistent_write(name, data))
+        self._writes.add(write)
+        write.add_done_callback(self._writes.discard)
+
+    async def _persistent_write(self, name: str, data: bytes) -> None:
+        try:
+            await asyncio.get_event_loop().run_in_executor(None, self.persistent.put, name, data)
+        except Exception as e:
+            logging.error(e)
+
+
+class AnimationCache(object):
+    """
+    Parsed source animations keyed by ``file_unique_id``.
+
+    :meth:`get` hands out private copies (see :func:`stickers.main.clone_animation`),
+    the cached originals are never modified.
+    ``max_bytes`` bounds the total size of the source JSON, the parsed objects take several times more memory.
+    """
+
+    def __init__(self, max_size: int = 32, max_bytes: int = 4 * 1024 * 1024) -> None:
+        self._animations = LRUCache(max_size=max_size, max_weight=max_bytes)
+
+    @classmethod
+    def from_env(cls):
+        return cls(
+            max_size=int(os.environ.get("STICKER_SOURCE_CACHE_SIZE", 32)),
+            max_bytes=int(os.environ.get("STICKER_SOURCE_CACHE_BYTES", 4 * 1024 * 1024)),
+        )
+
+    def get(self, file_unique_id: str):
+        animation = self._animations.get(file_unique_id)
+        if animation is None:
+            return None
+
+        from stickers.main import clone_animation
+
+        return clone_animation(animation)
+
+    def put(self, file_unique_id: str, animation, weight: int) -> None:
+        self._animations.put(file_unique_id, animation, weight=weight)
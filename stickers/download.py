@@ -0,0 +1,86 @@
+import io
+import os
+import zlib
+
+# Telegram itself does not accept animated stickers over 64 KiB
+MAX_TGS_BYTES = int(os.environ.get("STICKER_MAX_TGS_BYTES", 64 * 1024))
+MAX_JSON_BYTES = int(os.environ.get("STICKER_MAX_JSON_BYTES", 4 * 1024 * 1024))
+GZIP_MAGIC = b"\x1f\x8b"
+
+
+class StickerTooLarge(Exception):
+    """Raised when a sticker file or its JSON exceeds the size limits."""
+
+
+class TgsStream(io.RawIOBase):
+    """
+    Download destination that gunzips a .tgs file while its chunks arrive.
+
+    Only the sticker JSON is kept, :meth:`getvalue` returns it. Writing fails with :class:`StickerTooLarge`
+    as soon as the file or the JSON gets bigger than the limits, which aborts the download.
+    Plain (not gzipped) lottie JSON is kept as is.
+    """
+
+    def __init__(self, max_size: int = MAX_TGS_BYTES, max_json_size: int = MAX_JSON_BYTES) -> None:
+        super().__init__()
+        self.max_size = max_size
+        self.max_json_size = max_json_size
+        self.size = 0
+        self.json_size = 0
+        self._chunks = []
+        self._decompressor = None
+        self._started = False
+        # first bytes of the file until there are enough to tell gzip from plain JSON
+        self._head = b""
+
+    def expect(self, size: int) -> None:
+        """Fails early for a file whose size (e.g. ``Sticker.file_size``) is known to be over the limit."""
+        if size and size > self.max_size:
+            raise StickerTooLarge(f"Sticker file is {size} bytes, at most {self.max_size} are allowed")
+
+    def writable(self):
+        return True
+
+    def write(self, chunk) -> int:
+        chunk = bytes(chunk)
+        self.size += len(chunk)
+        self.expect(self.size)
+
+        if self._started:
+            self._consume(chunk)
+        else:
+            self._head += chunk
+            if len(self._head) >= len(GZIP_MAGIC):
+                self._start()
+        return len(chunk)
+
+    def _start(self) -> None:
+        self._started = True
+        if self._head.startswith(GZIP_MAGIC):
+            self._decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+        head, self._head = self._head, b""
+        self._consume(head)
+
+    def _consume(self, data: bytes) -> None:
+        if self._decompressor is None:
+            self._append(data)
+            return
+
+        while data:
+            # a bounded output, so a gzip bomb can not take more memory than the limit
+            self._append(self._decompressor.decompress(data, self.max_json_size - self.json_size + 1))
+            data = self._decompressor.unconsumed_tail
+
+    def _append(self, data: bytes) -> None:
+        self.json_size += len(data)
+        if self.json_size > self.max_json_size:
+            raise StickerTooLarge(f"Sticker JSON is over {self.max_json_size} bytes")
+        self._chunks.append(data)
+
+    def getvalue(self) -> bytes:
+        if not self._started:
+            # a file shorter than the gzip header
+            self._start()
+        if self._decompressor is not None and not self._decompressor.eof:
+            raise ValueError("Sticker file is truncated")
+        return b"".join(self._chunks)
@@ -0,0 +1,106 @@
+import math
+from json.encoder import encode_basestring
+
+_END = object()
+_NUMBER_TYPES = frozenset((int, float))
+
+
+class RawJSON(str):
+    """Already encoded JSON, :func:`iter_tgs_json` writes it out as is."""
+
+
+def tg_compress(d):
+    """Rounds every float inside the JSON-like ``d`` to 2 decimals, in place."""
+    stack = [d]
+    while stack:
+        node = stack.pop()
+        for k, v in node.items() if isinstance(node, dict) else enumerate(node):
+            if isinstance(v, float):
+                # decrease float precision
+                node[k] = round(v, 2)
+            elif isinstance(v, (dict, list)):
+                stack.append(v)
+
+
+def format_number(v):
+    if type(v) is int:
+        return int.__repr__(v)
+    if not math.isfinite(v):
+        # JSON has no NaN or infinity, the bare tokens would make the whole sticker unreadable
+        raise ValueError(f"Out of range float value {v!r} is not JSON compliant")
+    v = round(v, 2)
+    # integral values (and so zero vectors) are written without the fraction part
+    if v.is_integer():
+        return int.__repr__(int(v))
+    return float.__repr__(v)
+
+
+def iter_tgs_json(d):
+    """
+    Yields compact JSON text of ``d`` in fragments, with floats compressed as in :func:`tg_compress`.
+
+    Works iteratively, so the nesting depth of the animation is not limited by the recursion limit,
+    and does not modify ``d``.
+    """
+    # each frame is (iterator over the container, whether it is a dict)
+    frames = [(iter((d,)), False)]
+    first = True
+    while frames:
+        items, is_dict = frames[-1]
+        item = next(items, _END)
+        if item is _END:
+            frames.pop()
+            if frames:
+                yield "}" if is_dict else "]"
+            first = False
+            continue
+
+        if not first:
+            yield ","
+        first = False
+
+        if is_dict:
+            key, value = item
+            yield encode_basestring(key) + ":"
+        else:
+            value = item
+
+        if isinstance(value, RawJSON):
+            yield value
+        elif isinstance(value, str):
+            yield encode_basestring(value)
+        elif isinstance(value, float):
+            yield format_number(value)
+        elif value is True:
+            yield "true"
+        elif value is False:
+            yield "false"
+        elif value is None:
+            yield "null"
+        elif isinstance(value, int):
+            yield int.__repr__(value)
+        elif isinstance(value, dict):
+            yield "{"
+            frames.append((iter(value.items()), True))
+            first = True
+        elif isinstance(value, (list, tuple)):
+            if value and _NUMBER_TYPES.issuperset(map(type, value)):
+                # vectors and other flat number lists, the bulk of a sticker
+                yield "[" + ",".join(map(format_number, value)) + "]"
+            else:
+                yield "["
+                frames.append((iter(value), False))
+                first = True
+        else:
+            raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+def dump_tgs(d, fp, chunk_size=512):
+    """Writes ``d`` as compressed sticker JSON into the binary stream ``fp`` (usually a gzip file)."""
+    buffer = []
+    for fragment in iter_tgs_json(d):
+        buffer.append(fragment)
+        if len(buffer) >= chunk_size:
+            fp.write("".join(buffer).encode("utf-8"))
+            buffer.clear()
+    fp.write("".join(buffer).encode("utf-8"))
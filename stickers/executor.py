@@ -0,0 +1,193 @@
+import asyncio
+import io
+import logging
+import multiprocessing
+import os
+import threading
+from concurrent.futures import BrokenExecutor, ProcessPoolExecutor, ThreadPoolExecutor
+
+from stickers.cache import AnimationCache
+from utils import tracing
+
+# execution timeout of the function (see .github/workflows) and the webhook response deadline (see webhook.main),
+# a render gives up before both, while there is still time to answer
+FUNCTION_TIMEOUT = float(os.environ.get("FUNCTION_TIMEOUT", 7))
+RESPONSE_TIMEOUT = float(os.environ.get("WEBHOOK_RESPONSE_TIMEOUT", FUNCTION_TIMEOUT - 2))
+RENDER_TIMEOUT = max(min(FUNCTION_TIMEOUT - 2, RESPONSE_TIMEOUT - 1), 1)
+
+# parsed source animations of the current (worker) process
+_animations = None
+
+
+class RenderBusy(Exception):
+    """Raised when the render queue is full or a render does not finish in time."""
+
+
+def init_worker() -> None:
+    """Prepares the current process for rendering: creates its animation cache and loads the font."""
+    global _animations
+    from stickers.main import warm_up
+
+    if _animations is None:
+        _animations = AnimationCache.from_env()
+    warm_up()
+
+
+def render_job(source_id: str, data: bytes, lines: list, selected_animation: str = None) -> bytes:
+    """Renders ``lines`` over the sticker ``data``, the parsed source is reused while it is cached by ``source_id``."""
+    from stickers.main import clone_animation, load_animation, render
+
+    if _animations is None:
+        init_worker()
+
+    animation = _animations.get(source_id)
+    if animation is None:
+        parsed, weight = load_animation(io.BytesIO(data))
+        _animations.put(source_id, parsed, weight)
+        animation = clone_animation(parsed)
+
+    return render(animation, lines, selected_animation)
+
+
+def traced_render_job(*args) -> tuple:
+    """:func:`render_job` in a trace of its own, returns the output and the spans for the trace of the caller."""
+    trace = tracing.start()
+    return render_job(*args), trace.spans
+
+
+def _retrieve_exception(future) -> None:
+    if not future.cancelled():
+        future.exception()
+
+
+class RenderExecutor(object):
+    """
+    Runs :func:`render_job` off the event loop.
+
+    ``mode`` is one of:
+    - ``process``  a process pool, renders of different updates run in parallel. A worker takes as much memory
+                   as the handler, so it is only for servers such as ``test_server.py``, not a 128 MB function
+    - ``thread``   a thread pool, keeps the loop responsive but renders still share the GIL
+    - ``inline``   renders right in the calling coroutine, as before
+
+    At most ``max_pending`` renders are queued or running, further ones fail with :class:`RenderBusy`
+    right away. In the pool modes so does a render that takes longer than ``timeout`` seconds.
+    """
+
+    MODES = ("process", "thread", "inline")
+
+    def __init__(
+        self, mode: str = "thread", workers: int = 1, max_pending: int = 4, timeout: float = RENDER_TIMEOUT
+    ) -> None:
+        if mode not in self.MODES:
+            raise ValueError(f"Unknown render mode {mode!r}, expected one of {self.MODES}")
+
+        self.mode = mode
+        self.workers = workers
+        self.max_pending = max_pending
+        self.timeout = timeout
+        self._pending = 0
+        self._lock = threading.Lock()
+        self._executor = None
+
+    @classmethod
+    def from_env(cls):
+        # every worker holds its own lottie, fontTools and animation cache, more of them do not fit 128 MB
+        workers = int(os.environ.get("STICKER_RENDER_WORKERS", 1))
+        return cls(
+            mode=os.environ.get("STICKER_RENDER_MODE", "thread"),
+            workers=workers,
+            max_pending=int(os.environ.get("STICKER_RENDER_QUEUE", workers * 4)),
+            timeout=float(os.environ.get("STICKER_RENDER_TIMEOUT", RENDER_TIMEOUT)),
+        )
+
+    @property
+    def pending(self) -> int:
+        return self._pending
+
+    def start(self) -> None:
+        """Starts the workers and warms their caches up, called on the first render otherwise."""
+        if self._executor is not None:
+            return
+
+        if self.mode == "process":
+            # forking would copy the threads of the database driver in whatever state they are
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.workers,
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=init_worker,
+            )
+            # the pool starts its workers (and so their initializer) on the first submit, make it right now
+            self._executor.submit(os.getpid)
+        elif self.mode == "thread":
+            self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="render")
+            init_worker()
+        else:
+            self._executor = False
+            init_worker()
+        logging.info(f"Sticker renderer started: {self.mode}, {self.workers} worker(s)")
+
+    def shutdown(self, wait: bool = True) -> None:
+        if self._executor:
+            self._executor.shutdown(wait=wait)
+        self._executor = None
+
+    async def render(self, source_id: str, data: bytes, lines: list, selected_animation: str = None) -> bytes:
+        with self._lock:
+            if self._pending >= self.max_pending:
+                raise RenderBusy(f"{self._pending} renders are already pending")
+            self._pending += 1
+
+        if self.mode == "inline":
+            try:
+                self.start()
+                return render_job(source_id, data, lines, selected_animation)
+            finally:
+                self._release()
+
+        # spans of the worker do not reach the trace of the update by themselves
+        trace = tracing.current()
+        job = render_job if trace is None else traced_render_job
+        try:
+            self.start()
+            executor = self._executor
+            future = executor.submit(job, source_id, data, lines, selected_animation)
+        except BrokenExecutor as e:
+            self._release()
+            self._restart(self._executor, e)
+            raise RenderBusy("Render workers are being restarted") from e
+        except BaseException:
+            self._release()
+            raise
+        # the slot is freed only when the worker is really done, even if we stop waiting earlier
+        future.add_done_callback(self._release)
+        waited = asyncio.wrap_future(future)
+        # nobody awaits it any more after a timeout, its error must not be reported as never retrieved
+        waited.add_done_callback(_retrieve_exception)
+        try:
+            result = await asyncio.wait_for(asyncio.shield(waited), self.timeout)
+        except asyncio.TimeoutError:
+            raise RenderBusy(f"Render did not finish in {self.timeout} seconds")
+        except BrokenExecutor as e:
+            # e.g. a worker was killed for going over the memory limit
+            self._restart(executor, e)
+            raise RenderBusy("Render worker died") from e
+        if trace is None:
+            return result
+        output, spans = result
+        trace.merge(spans)
+        return output
+
+    def _restart(self, executor, error) -> None:
+        """Drops a broken pool, the next render starts a new one."""
+        with self._lock:
+            if executor is None or self._executor is not executor:
+                # already replaced by another render
+                return
+            self._executor = None
+        logging.error(f"Render pool is broken, restarting it: {error}")
+        executor.shutdown(wait=False)
+
+    def _release(self, *args) -> None:
+        with self._lock:
+            self._pending -= 1
@@ -1,19 +1,36 @@
-import codecs
+import copy
 import gzip
 import io
-import json
 import os
 import random
+import string
 
 import fontTools
 import lottie
 from lottie.nvector import NVector
+from lottie.objects.base import LottieBase
+from lottie.objects.bezier import Bezier
 from lottie.objects.shapes import Group, Path
 from lottie.utils import animation
 from lottie.utils.font import BezierPen
 
+from stickers import DEFAULT_ANIMATIONS, vectorized
+from stickers.encoder import RawJSON, dump_tgs, iter_tgs_json, tg_compress  # noqa: F401
+from utils import codec, tracing
+from utils.cache import LRUCache
+
 FONT_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "impact.ttf")
 
+_font_renderers = {}
+# finished text lines, see TextPrinter.create_text_line
+_text_lines = LRUCache(
+    max_size=int(os.environ.get("STICKER_LINE_CACHE_SIZE", 256)),
+    max_weight=int(os.environ.get("STICKER_LINE_CACHE_BYTES", 8 * 1024 * 1024)),
+)
+
+CYRILLIC = "АБВГДЕЁЖЗИЙКЛМНОПРСТУФХЦЧШЩЪЫЬЭЮЯабвгдеёжзийклмнопрстуфхцчшщъыьэюя"
+WARM_UP_CHARS = string.ascii_letters + string.digits + string.punctuation + CYRILLIC
+
 
 def closest(lst, K):
     return lst[min(range(len(lst)), key=lambda i: abs(lst[i] - K))]
@@ -40,23 +57,51 @@ def validate_and_fix(an):
         an.threedimensional = 0
 
 
-def tg_compress(d):
-    my_list = d.items() if isinstance(d, dict) else enumerate(d)
+def load_animation(file):
+    """Parses a .tgs (or plain lottie) file, returns the animation and the size of its JSON in bytes."""
+    with tracing.span("sticker.load"):
+        data = file.read()
+        if data[:2] == b"\x1f\x8b":
+            data = gzip.decompress(data)
+        return lottie.objects.animation.Animation.load(codec.loads(data)), len(data)
 
-    for k, v in my_list:
-        if isinstance(v, dict) or isinstance(v, list):
-            # remove zero arrays
 
-            if all([q == [0, 0] for q in d]):
-                d = []
-            # elif v == [0, 0]:
-            #     d[k] = []
-            else:
-                tg_compress(v)
-        else:
-            if isinstance(v, float):
-                # decrease float precision
-                d[k] = round(v, 2)
+def clone_animation(an):
+    """
+    Returns a copy of ``an`` that can be passed to :class:`TextPrinter`.
+
+    Layers are shared with the original: ``add_text`` only inserts a new layer
+    and fixes top level fields, so copying the layer list is enough to keep the original intact.
+    """
+    clone = copy.copy(an)
+    clone.layers = list(an.layers)
+    clone._index_gen = copy.copy(an._index_gen)
+    return clone
+
+
+def get_font_renderer(filename=FONT_PATH):
+    """Returns the process-wide renderer for ``filename``, the font is parsed on first use only."""
+    renderer = _font_renderers.get(filename)
+    if renderer is None:
+        renderer = _font_renderers[filename] = FontRenderer(filename)
+    return renderer
+
+
+def warm_up(chars=WARM_UP_CHARS):
+    """Loads the font and draws the glyphs of ``chars``, so the first sticker renders as fast as the next ones."""
+    renderer = get_font_renderer()
+    for ch in chars:
+        renderer.glyph(renderer.cmap.get(ord(ch)) or renderer.font._makeGlyphName(ord(ch)))
+
+
+def place_bezier(bezier, offset, scale):
+    """Returns a copy of a unit-scale glyph ``bezier`` moved by ``offset`` (in font units) and scaled."""
+    placed = Bezier()
+    placed.closed = bezier.closed
+    placed.vertices = [(v + offset) * scale for v in bezier.vertices]
+    placed.in_tangents = [t * scale for t in bezier.in_tangents]
+    placed.out_tangents = [t * scale for t in bezier.out_tangents]
+    return placed
 
 
 class FontRenderer:
@@ -65,14 +110,32 @@ class FontRenderer:
         self.font = fontTools.ttLib.TTFont(filename)
         self.glyphset = self.font.getGlyphSet()
         self.cmap = self.font.getBestCmap() or {}
+        # glyph name -> (beziers at unit scale and zero offset, advance width) or None for missing glyphs
+        self._glyphs = {}
+
+    def glyph(self, name):
+        """Returns cached ``(beziers, width)`` of the glyph, drawing it through the pen on first use only."""
+        try:
+            return self._glyphs[name]
+        except KeyError:
+            pass
+
+        if name in self.glyphset:
+            glyph = self.glyphset[name]
+            pen = BezierPen(self.glyphset)
+            glyph.draw(pen)
+            cached = (pen.beziers, glyph.width)
+        else:
+            cached = None
+        self._glyphs[name] = cached
+        return cached
 
-    def glyph_beziers(self, name, offset=NVector(0, 0)):
-        pen = BezierPen(self.glyphset, offset)
-        self.glyphset[name].draw(pen)
-        return pen.beziers
+    def glyph_beziers(self, name, offset=NVector(0, 0), scale=1):
+        beziers, _ = self.glyph(name)
+        return [place_bezier(bez, offset, scale) for bez in beziers]
 
-    def glyph_shapes(self, name, offset=NVector(0, 0)):
-        beziers = self.glyph_beziers(name, offset)
+    def glyph_shapes(self, name, offset=NVector(0, 0), scale=1):
+        beziers = self.glyph_beziers(name, offset, scale)
         return [Path(bez) for bez in beziers]
 
     def glyph_group(self, name):
@@ -105,6 +168,9 @@ class FontRenderer:
         if pos is None:
             pos = NVector(0, 0)
         # group.transform.scale.value = NVector(100, 100) * scale
+        path_type = vectorized.ArrayPath if vectorized.ENABLED else Path
+        # paths are added in text order right away, their beziers are placed for the whole line at once below
+        paths, unit_beziers, offsets = [], [], []
         for ch in text:
             if ch == "\n":
                 pos.x = 0
@@ -112,18 +178,28 @@ class FontRenderer:
                 continue
 
             chname = self.cmap.get(ord(ch)) or self.font._makeGlyphName(ord(ch))
-            if chname in self.glyphset:
-                glyph_shapes = self.glyph_shapes(chname, pos / scale)
-                glyph_shape_group = group.add_shape(Group()) if len(glyph_shapes) > 1 else group
-
-                for sh in glyph_shapes:
-                    sh.shape.value.scale(scale)
-                    glyph_shape_group.add_shape(sh)
-
-                pos.x += self.glyphset[chname].width * scale
+            glyph = self.glyph(chname)
+            if glyph is not None:
+                beziers, width = glyph
+                offset = pos / scale
+                glyph_shape_group = group.add_shape(Group()) if len(beziers) > 1 else group
+
+                for bez in beziers:
+                    paths.append(glyph_shape_group.add_shape(path_type()))
+                    unit_beziers.append(bez)
+                    offsets.append(offset)
+
+                pos.x += width * scale
             elif on_missing:
                 on_missing(ch, size, pos, group)
 
+        if vectorized.ENABLED:
+            placed = vectorized.place_beziers(unit_beziers, offsets, scale)
+        else:
+            placed = [place_bezier(bez, offset, scale) for bez, offset in zip(unit_beziers, offsets)]
+        for path, bez in zip(paths, placed):
+            path.shape.value = bez
+
         group.line_height = line_height
         return group
 
@@ -131,15 +207,32 @@ class FontRenderer:
         return "<FontRenderer %r>" % self.filename
 
 
+class RenderedShape(LottieBase):
+    """Shape serialized in advance, it is written into the sticker as is and shared between stickers."""
+
+    def __init__(self, json: RawJSON):
+        self.json = json
+
+    def to_dict(self):
+        return self.json
+
+    def clone(self):
+        return self
+
+
 class TextPrinter(object):
+    default_animations = DEFAULT_ANIMATIONS
+
     def __init__(self, file, selected_animation=None):
         self.infile_path = file
         self.tg_sticker = self._load_sticker_file(file)
 
-        self.default_animations = ("shake", "spring_pull_top", "spring_pull_right")
         self.selected_animation = selected_animation or random.choice(self.default_animations)
 
     def _load_sticker_file(self, file):
+        if isinstance(file, lottie.objects.animation.Animation):
+            return file
+
         lottie_json = lottie.parsers.tgs.parse_tgs_json(file)
 
         return lottie.objects.animation.Animation.load(lottie_json)
@@ -155,31 +248,60 @@ class TextPrinter(object):
         if middle_line is not None and len(middle_line):
             layer.add_shape(self.create_text_line(middle_line, middle=True))
 
-        validate_and_fix(self.tg_sticker)
-
-        output_dict = self.tg_sticker.to_dict()
-
-        tg_compress(output_dict)
+        with tracing.span("sticker.validate"):
+            validate_and_fix(self.tg_sticker)
+        # lottie objects can only serialize themselves into a dict, which is all the to_dict pass does
+        # (the cached text lines are already JSON, see RenderedShape), the encoder then walks that dict once
+        with tracing.span("sticker.to_dict"):
+            data = self.tg_sticker.to_dict()
 
         output = io.BytesIO()
-        with gzip.open(output, "w") as g:
-            json.dump(output_dict, codecs.getwriter("utf-8")(g), separators=(",", ":"), ensure_ascii=False)
+        # float compression, JSON and gzip are done in the same pass
+        with tracing.span("sticker.encode"), gzip.open(output, "w") as g:
+            dump_tgs(data, g)
         output.seek(0)
         return output
 
     def create_text_line(self, text: str, middle: bool = False, bottom: bool = False):
-        line_group = lottie.objects.Group()
+        """
+        Returns the animated group of a text line.
 
-        line_shapes_group = FontRenderer(FONT_PATH).render(text, size=64, pos=lottie.nvector.NVector(0, 0))
-        text_length = len(text)
+        The line does not depend on the sticker itself, only on its timing, so finished lines are cached
+        in the process and the same phrase on another sticker is not laid out and animated again.
+        """
         tg_seconds = self.tg_sticker.out_point / self.tg_sticker.frame_rate
         self.selected_animation = self.selected_animation if tg_seconds >= 1.5 else "shake"
 
+        key = (
+            text,
+            "bottom" if bottom else "middle" if middle else "top",
+            self.selected_animation,
+            self.tg_sticker.out_point,
+            self.tg_sticker.frame_rate,
+        )
+        line = _text_lines.get(key)
+        if line is None:
+            with tracing.span("sticker.layout"):
+                line_group = self._build_text_line(text, middle, bottom)
+                line = RenderedShape(RawJSON("".join(iter_tgs_json(line_group.to_dict()))))
+            _text_lines.put(key, line, weight=len(line.json))
+        return line
+
+    def _build_text_line(self, text: str, middle: bool, bottom: bool):
+        line_group = lottie.objects.Group()
+
+        line_shapes_group = get_font_renderer().render(text, size=64, pos=lottie.nvector.NVector(0, 0))
+        text_length = len(text)
+
+        letter_groups = []
         for index, letter_shape in enumerate(line_shapes_group.shapes):
             letter_group = line_group.add_shape(lottie.objects.Group())
             letter_group.add_shape(letter_shape)
+            letter_groups.append(letter_group)
             # make letters moving
-            if self.selected_animation == "shake":
+            if vectorized.ENABLED:
+                continue
+            elif self.selected_animation == "shake":
                 animation.shake(
                     letter_group.transform.position, 5, 5, 0, self.tg_sticker.out_point, self.tg_sticker.frame_rate // 2
                 )
@@ -198,6 +320,11 @@ class TextPrinter(object):
             #                           index * (total_frames_for_effect / text_length),
             #                           self.tg_sticker.out_point // 1.7, 7, 7)
 
+        if vectorized.ENABLED:
+            vectorized.animate_letters(
+                letter_groups, self.selected_animation, self.tg_sticker.out_point, self.tg_sticker.frame_rate, text_length
+            )
+
         line_group_x = (512 - line_shapes_group.bounding_box().width) / 2
         line_group_y = 80
         if bottom:
@@ -227,3 +354,17 @@ class TextPrinter(object):
         line_group.add_shape(lottie.objects.Stroke(lottie.Color(0, 0, 0), 7))
 
         return line_group
+
+
+def render(file, lines, selected_animation=None) -> bytes:
+    """Renders up to three text ``lines`` over the sticker from ``file`` and returns the .tgs bytes."""
+    tp = TextPrinter(file, selected_animation)
+
+    if len(lines) == 1:
+        output = tp.add_text(top_line=lines[0])
+    if len(lines) == 2:
+        output = tp.add_text(top_line=lines[0], bottom_line=lines[1])
+    if len(lines) >= 3:
+        output = tp.add_text(top_line=lines[0], middle_line=lines[1], bottom_line=lines[2])
+
+    return output.getvalue()
@@ -0,0 +1,173 @@
+"""
+Optional NumPy backed helpers for :class:`stickers.main.FontRenderer` and :class:`stickers.main.TextPrinter`.
+
+Glyph outlines of a whole line are placed with one array operation and letter animations
+are generated for all letters at once. The results stay in arrays until the sticker is serialized.
+Used when NumPy is installed, unless ``STICKER_NUMPY=0``. NumPy is not in requirements.txt:
+it is an optional extra (requirements-numpy.txt) because its import takes about 15 MiB of the 128 MB function.
+"""
+import math
+import os
+
+from lottie.nvector import NVector
+from lottie.objects.bezier import Bezier
+from lottie.objects.properties import PositionValue
+from lottie.objects.shapes import BoundingBox, Path
+
+from stickers.encoder import RawJSON, format_number
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+ENABLED = np is not None and os.environ.get("STICKER_NUMPY", "1") != "0"
+
+# id(unit bezier) -> (unit bezier, (vertices, in tangents, out tangents)), unit beziers live as long as the font
+_unit_arrays = {}
+
+
+def _points_json(points):
+    """``(n, 2)`` array -> list of encoded ``[x,y]`` pairs."""
+    numbers = list(map(format_number, points.ravel().tolist()))
+    return [f"[{x},{y}]" for x, y in zip(numbers[::2], numbers[1::2])]
+
+
+class ArrayBezier(Bezier):
+    """Bezier keeping its points in ``(n, 2)`` arrays, they are encoded straight to JSON by :meth:`to_dict`."""
+
+    def __init__(self, closed=False, vertices=None, in_tangents=None, out_tangents=None):
+        super().__init__()
+        self.closed = closed
+        self.vertices = vertices
+        self.in_tangents = in_tangents
+        self.out_tangents = out_tangents
+
+    def to_dict(self):
+        closed = "true" if self.closed else "false"
+        in_tangents = ",".join(_points_json(self.in_tangents))
+        out_tangents = ",".join(_points_json(self.out_tangents))
+        vertices = ",".join(_points_json(self.vertices))
+        return RawJSON(f'{{"c":{closed},"i":[{in_tangents}],"o":[{out_tangents}],"v":[{vertices}]}}')
+
+    def clone(self):
+        return ArrayBezier(self.closed, self.vertices.copy(), self.in_tangents.copy(), self.out_tangents.copy())
+
+
+class ArrayPath(Path):
+    def bounding_box(self, time=0):
+        vertices = self.shape.value.vertices
+        if not len(vertices):
+            return BoundingBox()
+        x1, y1 = vertices.min(axis=0).tolist()
+        x2, y2 = vertices.max(axis=0).tolist()
+        return BoundingBox(x1, y1, x2, y2)
+
+
+class KeyframeTrack(PositionValue):
+    """Position animated linearly through ``values`` (``(n, 2)``) at ``times`` (``(n,)``)."""
+
+    def __init__(self, times, values):
+        super().__init__(NVector(0, 0))
+        self.value = None
+        self.animated = True
+        self.times = times
+        self.values = values
+
+    def to_dict(self):
+        times = list(map(format_number, self.times.tolist()))
+        values = _points_json(self.values)
+        keyframes = [
+            f'{{"t":{t},"i":{{"x":[1],"y":[1]}},"o":{{"x":[0],"y":[0]}},"s":{start},"e":{end}}}'
+            for t, start, end in zip(times, values, values[1:])
+        ]
+        keyframes.append(f'{{"t":{times[-1]},"s":{values[-1]}}}')
+        return {"a": 1, "k": RawJSON("[" + ",".join(keyframes) + "]")}
+
+
+def _arrays(bezier):
+    cached = _unit_arrays.get(id(bezier))
+    if cached is None:
+        cached = _unit_arrays[id(bezier)] = (
+            bezier,
+            tuple(
+                np.array([v.components for v in points], dtype=float).reshape(-1, 2)
+                for points in (bezier.vertices, bezier.in_tangents, bezier.out_tangents)
+            ),
+        )
+    return cached[1]
+
+
+def place_beziers(beziers, offsets, scale):
+    """Vectorized :func:`stickers.main.place_bezier` for many unit-scale glyph beziers at once."""
+    if not beziers:
+        return []
+
+    arrays = [_arrays(bez) for bez in beziers]
+    counts = [len(a[0]) for a in arrays]
+    shift = np.repeat(np.array([o.components for o in offsets], dtype=float), counts, axis=0)
+    split = np.cumsum(counts)[:-1]
+
+    vertices = (np.concatenate([a[0] for a in arrays]) + shift) * scale
+    in_tangents = np.concatenate([a[1] for a in arrays]) * scale
+    out_tangents = np.concatenate([a[2] for a in arrays]) * scale
+
+    return [
+        ArrayBezier(bez.closed, v, i, o)
+        for bez, v, i, o in zip(
+            beziers, np.split(vertices, split), np.split(in_tangents, split), np.split(out_tangents, split)
+        )
+    ]
+
+
+def shake_tracks(count, x_radius, y_radius, start_time, end_time, n_frames, start=(0, 0)):
+    """``lottie.utils.animation.shake`` for ``count`` independent positions starting at ``start``."""
+    n_frames = int(round(n_frames))
+    frame_time = (end_time - start_time) / n_frames
+    times = np.append(start_time + np.arange(n_frames) * frame_time, end_time)
+
+    jitter = (np.random.random((count, n_frames, 2)) * 2 - 1) * [x_radius, y_radius]
+    values = np.empty((count, n_frames + 1, 2))
+    values[:, :-1] = np.asarray(start, dtype=float) + jitter
+    values[:, -1] = start
+    return [KeyframeTrack(times, v) for v in values]
+
+
+def spring_pull_tracks(start, point, start_times, end_time, falloff=15, oscillations=7):
+    """``lottie.utils.animation.spring_pull`` from ``start`` to ``point`` for every time in ``start_times``."""
+    start = np.asarray(start, dtype=float)
+    point = np.asarray(point, dtype=float)
+    d = start - point
+    factors = []
+    for i in range(oscillations):
+        time_x = i / oscillations
+        factors.append(math.cos(time_x * math.pi * oscillations) * (1 - time_x ** (1 / falloff)))
+    # the values are the same for every track, only the timing differs
+    values = np.vstack([point + d * np.array(factors)[:, None], point])
+
+    start_times = np.asarray(start_times, dtype=float)
+    delta = (end_time - start_times) / oscillations
+    times = np.empty((len(start_times), oscillations + 1))
+    times[:, :-1] = start_times[:, None] + delta[:, None] * np.arange(oscillations)
+    times[:, -1] = end_time
+    return [KeyframeTrack(t, values) for t in times]
+
+
+def animate_letters(letter_groups, selected_animation, out_point, frame_rate, text_length):
+    """Batched per-letter part of :meth:`stickers.main.TextPrinter.create_text_line`."""
+    if selected_animation == "shake":
+        tracks = shake_tracks(len(letter_groups), 5, 5, 0, out_point, frame_rate // 2)
+        for letter_group, track in zip(letter_groups, tracks):
+            letter_group.transform.position = track
+    elif selected_animation == "spring_pull_top":
+        end_time = out_point // 1.7
+        pulled = []
+        for index, letter_group in enumerate(letter_groups):
+            letter_group.transform.position.value = NVector(0, -512)
+            start_time = index * (end_time / text_length)
+            if start_time < end_time:
+                pulled.append((letter_group, start_time))
+        if pulled:
+            tracks = spring_pull_tracks((0, -512), (0, 0), [s for _, s in pulled], end_time, 7, 7)
+            for (letter_group, _), track in zip(pulled, tracks):
+                letter_group.transform.position = track
@@ -1,13 +1,12 @@
 import logging
 import os
 
-from aiogram import Bot, filters
 from aiogram.contrib.middlewares.logging import LoggingMiddleware
 from aiogram.dispatcher import Dispatcher
 from aiogram.utils.executor import start_webhook
-from aiogram.types import ContentType
 
-from handlers import users
+from handlers import register_handlers
+from webhook import WebhookBot
 from middlewares import UserMiddleware
 
 try:
@@ -18,6 +17,8 @@ except:  # noqa
     pass
 
 API_TOKEN = os.environ.get("TG_TOKEN_TEST")
+# a long running server has the memory for render workers, the function renders in a thread
+os.environ.setdefault("STICKER_RENDER_MODE", "process")
 
 # webhook settings
 WEBHOOK_HOST = os.environ.get("WEBHOOK_HOST_TEST")
@@ -30,23 +31,28 @@ WEBAPP_PORT = 3001
 
 logging.basicConfig(level=logging.INFO)
 
-bot = Bot(token=API_TOKEN)
+bot = WebhookBot(token=API_TOKEN)
 dp = Dispatcher(bot)
 dp.middleware.setup(LoggingMiddleware())
 dp.middleware.setup(UserMiddleware())
 
 
 async def on_startup(dp):
-    dp.register_message_handler(users.commands.start, commands=["start"])
-    dp.register_message_handler(users.commands.bot_help, commands=["help"])
-    dp.register_message_handler(users.attachments.sticker, content_types=ContentType.STICKER)
-    dp.register_message_handler(users.messages.say, filters.IsReplyFilter)
+    await register_handlers(dp)
+
+    from loader import render_executor, storage
+
+    render_executor.start()
+    storage.start()
 
     await bot.set_webhook(WEBHOOK_URL)
     # insert code here to run it after start
 
 
 async def on_shutdown(dp):
+    from loader import render_executor, sticker_cache
+    from utils.models import flush_counters
+
     logging.warning("Shutting down..")
 
     # insert code here to run it before shutdown
@@ -54,6 +60,12 @@ async def on_shutdown(dp):
     # Remove webhook (not acceptable in some cases)
     await bot.delete_webhook()
 
+    render_executor.shutdown()
+    await flush_counters()
+    await sticker_cache.flush()
+
+    await WebhookBot.close_shared_session()
+
     # Close DB connection (if used)
     await dp.storage.close()
     await dp.storage.wait_closed()
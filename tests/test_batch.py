@@ -0,0 +1,71 @@
+import asyncio
+import unittest
+
+from aiogram import Bot, Dispatcher, types
+
+from webhook import WebhookRequestHandler
+
+
+def message_update(update_id: int, chat_id: int, text: str) -> types.Update:
+    return types.Update.to_object(
+        {
+            "update_id": update_id,
+            "message": {
+                "message_id": update_id,
+                "date": 1616600000,
+                "chat": {"id": chat_id, "type": "private"},
+                "from": {"id": chat_id, "is_bot": False, "first_name": "Test"},
+                "text": text,
+            },
+        }
+    )
+
+
+class ProcessUpdatesTest(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.dp = Dispatcher(Bot(token="1700000000:test", validate_token=False))
+        self.events = []
+        self.running = 0
+        self.max_running = 0
+        self.dp.register_message_handler(self.handler)
+
+    async def handler(self, message: types.Message):
+        self.running += 1
+        self.max_running = max(self.max_running, self.running)
+        self.events.append(("start", message.chat.id, message.message_id))
+        # later updates of a chat finish sooner, so they would overtake the earlier ones if run together
+        await asyncio.sleep(0.01 * (10 - message.message_id % 10))
+        self.events.append(("end", message.chat.id, message.message_id))
+        self.running -= 1
+        if message.text == "fail":
+            raise ValueError("failed")
+
+    async def test_updates_of_a_chat_are_processed_in_order(self):
+        updates = [message_update(i, chat_id=i % 2 + 1, text="hi") for i in range(1, 9)]
+        results = await WebhookRequestHandler(self.dp).process_updates(updates, concurrency=8)
+
+        self.assertEqual([result["update_id"] for result in results], list(range(1, 9)))
+        self.assertTrue(all(result["ok"] for result in results))
+        for chat_id in (1, 2):
+            chat_events = [(event, update_id) for event, chat, update_id in self.events if chat == chat_id]
+            expected = [(event, i) for i in range(1, 9) if i % 2 + 1 == chat_id for event in ("start", "end")]
+            self.assertEqual(chat_events, expected)
+        # the two chats ran at the same time
+        self.assertEqual(self.max_running, 2)
+
+    async def test_concurrency_bounds_the_chats_processed_at_once(self):
+        updates = [message_update(i, chat_id=i, text="hi") for i in range(1, 7)]
+        await WebhookRequestHandler(self.dp).process_updates(updates, concurrency=3)
+        self.assertEqual(self.max_running, 3)
+
+    async def test_failed_update_does_not_stop_its_chat(self):
+        updates = [message_update(1, 1, "fail"), message_update(2, 1, "hi")]
+        with self.assertLogs(level="ERROR"):
+            results = await WebhookRequestHandler(self.dp).process_updates(updates, concurrency=8)
+
+        self.assertEqual([result["ok"] for result in results], [False, True])
+        self.assertEqual(results[0]["error"], "failed")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,151 @@
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+from stickers.cache import DiskTier, ResultCache
+from utils.cache import LRUCache, TTLCache
+
+
+class LRUCacheTest(unittest.TestCase):
+    def test_least_recently_used_item_is_evicted(self):
+        cache = LRUCache(max_size=2)
+        cache.put("a", 1)
+        cache.put("b", 2)
+        self.assertEqual(cache.get("a"), 1)
+        cache.put("c", 3)
+
+        self.assertNotIn("b", cache)
+        self.assertEqual((cache.get("a"), cache.get("c")), (1, 3))
+        self.assertEqual(cache.stats(), {"size": 2, "weight": 2, "hits": 3, "misses": 0})
+
+    def test_items_are_evicted_over_the_weight(self):
+        cache = LRUCache(max_size=10, max_weight=10)
+        cache.put("a", b"a", weight=4)
+        cache.put("b", b"b", weight=4)
+        cache.put("c", b"c", weight=4)
+
+        self.assertNotIn("a", cache)
+        self.assertEqual(cache.weight, 8)
+
+    def test_item_over_the_weight_is_not_kept(self):
+        cache = LRUCache(max_size=10, max_weight=10)
+        cache.put("a", b"a", weight=4)
+        cache.put("b", b"b", weight=11)
+
+        self.assertNotIn("b", cache)
+        self.assertEqual(cache.weight, 4)
+
+    def test_replaced_and_popped_items_give_their_weight_back(self):
+        cache = LRUCache(max_size=10, max_weight=10)
+        cache.put("a", b"a", weight=4)
+        cache.put("a", b"aa", weight=6)
+        self.assertEqual(cache.weight, 6)
+
+        self.assertEqual(cache.pop("a"), b"aa")
+        self.assertEqual(cache.weight, 0)
+        self.assertIsNone(cache.get("a"))
+        self.assertEqual(cache.misses, 1)
+
+
+class TTLCacheTest(unittest.TestCase):
+    def test_items_expire_after_the_ttl(self):
+        cache = TTLCache(max_size=10, ttl=60)
+        with mock.patch("utils.cache.main.time.monotonic", return_value=1000):
+            cache.put("a", 1)
+        with mock.patch("utils.cache.main.time.monotonic", return_value=1059):
+            self.assertEqual(cache.get("a"), 1)
+        with mock.patch("utils.cache.main.time.monotonic", return_value=1061):
+            self.assertIsNone(cache.get("a"))
+
+        self.assertNotIn("a", cache)
+        self.assertEqual(cache.stats(), {"size": 0, "weight": 0, "hits": 1, "misses": 1, "expired": 1})
+
+    def test_put_restarts_the_ttl(self):
+        cache = TTLCache(max_size=10, ttl=60)
+        with mock.patch("utils.cache.main.time.monotonic", return_value=1000):
+            cache.put("a", 1)
+        with mock.patch("utils.cache.main.time.monotonic", return_value=1050):
+            cache.put("a", 2)
+        with mock.patch("utils.cache.main.time.monotonic", return_value=1100):
+            self.assertEqual(cache.get("a"), 2)
+
+    def test_size_and_weight_still_bound_it(self):
+        cache = TTLCache(max_size=2, ttl=60, max_weight=10)
+        cache.put("a", 1)
+        cache.put("b", 2)
+        cache.put("c", 3)
+        self.assertNotIn("a", cache)
+
+        cache.put("d", 4, weight=10)
+        self.assertEqual(len(cache), 1)
+        self.assertEqual(cache.pop("d"), 4)
+        self.assertIsNone(cache.pop("d"))
+
+
+class FailingTier(object):
+    def get(self, name: str):
+        raise OSError("unavailable")
+
+    def put(self, name: str, data: bytes) -> None:
+        raise OSError("unavailable")
+
+
+class ResultCacheTest(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+        self.tier = DiskTier(self.directory.name)
+
+    async def test_keys_depend_on_sticker_lines_and_animation(self):
+        key = ResultCache.make_key("sticker", ["hello"], "shake")
+        self.assertEqual(key, ResultCache.make_key("sticker", ["hello"], "shake"))
+        self.assertNotEqual(key, ResultCache.make_key("other", ["hello"], "shake"))
+        self.assertNotEqual(key, ResultCache.make_key("sticker", ["hello", ""], "shake"))
+        self.assertNotEqual(key, ResultCache.make_key("sticker", ["hello"], "spring_pull_top"))
+
+    async def test_memory_only(self):
+        cache = ResultCache()
+        self.assertIsNone(await cache.get("key"))
+        cache.put("key", b"tgs")
+        cache.put_file_id("key", 1, "file-id")
+
+        self.assertEqual(await cache.get("key"), b"tgs")
+        self.assertEqual(await cache.get_file_id("key", 1), "file-id")
+        # file ids belong to the bot that uploaded the sticker
+        self.assertIsNone(await cache.get_file_id("key", 2))
+
+    async def test_flush_waits_for_the_persistent_tier(self):
+        cache = ResultCache(persistent=self.tier)
+        cache.put("key", b"tgs")
+        cache.put_file_id("key", 1, "file-id")
+        await cache.flush()
+
+        self.assertEqual(sorted(os.listdir(self.directory.name)), ["key.1.id", "key.tgs"])
+
+    async def test_persistent_tier_fills_the_memory_tier(self):
+        cache = ResultCache(persistent=self.tier)
+        cache.put("key", b"tgs")
+        cache.put_file_id("key", 1, "file-id")
+        await cache.flush()
+
+        # another instance, with nothing in memory
+        cache = ResultCache(persistent=self.tier)
+        self.assertEqual(await cache.get("key"), b"tgs")
+        self.assertEqual(await cache.get_file_id("key", 1), "file-id")
+
+        cache.persistent = None
+        self.assertEqual(await cache.get("key"), b"tgs")
+        self.assertEqual(await cache.get_file_id("key", 1), "file-id")
+
+    async def test_persistent_tier_errors_are_misses(self):
+        cache = ResultCache(persistent=FailingTier())
+        with self.assertLogs(level="ERROR"):
+            cache.put("key", b"tgs")
+            await cache.flush()
+            self.assertIsNone(await cache.get_file_id("key", 1))
+        self.assertEqual(await cache.get("key"), b"tgs")
+
+
+if __name__ == "__main__":
+    unittest.main()
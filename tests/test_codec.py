@@ -0,0 +1,52 @@
+import json
+import sys
+import unittest
+from unittest import mock
+
+from utils.codec import CODECS, load_codec
+
+DOCUMENT = {"update_id": 1, "message": {"text": "Привет / </script>", "entities": [], "ok": True, "score": 1.5}}
+
+
+def installed(name: str) -> bool:
+    try:
+        load_codec(name)
+    except ImportError:
+        return False
+    return True
+
+
+class LoadCodecTest(unittest.TestCase):
+    def test_every_installed_codec_round_trips(self):
+        for name in CODECS:
+            if not installed(name):
+                continue
+            _, loads, dumps = load_codec(name)
+            text = dumps(DOCUMENT)
+            self.assertIsInstance(text, str)
+            self.assertEqual(json.loads(text), DOCUMENT, name)
+            self.assertEqual(loads(json.dumps(DOCUMENT)), DOCUMENT, name)
+            self.assertEqual(loads(text.encode("utf-8")), DOCUMENT, name)
+
+    def test_falls_back_to_the_next_installed_codec(self):
+        with mock.patch.dict(sys.modules, {"orjson": None}):
+            name, _, _ = load_codec()
+        self.assertEqual(name, "ujson" if installed("ujson") else "json")
+
+        with mock.patch.dict(sys.modules, {"orjson": None, "ujson": None}):
+            name, loads, _ = load_codec()
+        self.assertEqual(name, "json")
+        self.assertIs(loads, json.loads)
+
+    def test_requested_codec_that_is_not_installed(self):
+        with mock.patch.dict(sys.modules, {"orjson": None}):
+            with self.assertRaises(ImportError):
+                load_codec("orjson")
+
+    def test_unknown_codec(self):
+        with self.assertRaises(ValueError):
+            load_codec("simplejson")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,98 @@
+import asyncio
+import unittest
+
+from utils.models import StickerCounter
+from utils.storage import MemoryStorage
+
+
+class RecordingStorage(MemoryStorage):
+    """Memory storage that records the batches it is given and fails the first ``failures`` of them."""
+
+    def __init__(self, failures: int = 0, fail_after_write: bool = False) -> None:
+        super().__init__()
+        self.failures = failures
+        self.fail_after_write = fail_after_write
+        self.batch_ids = []
+
+    async def add_stickers(self, increments: dict, batch_id: str) -> None:
+        self.batch_ids.append(batch_id)
+        if self.failures and not self.fail_after_write:
+            self.failures -= 1
+            raise TimeoutError("not written")
+        await super().add_stickers(increments, batch_id)
+        if self.failures:
+            # written, but the caller does not know it
+            self.failures -= 1
+            raise TimeoutError("written")
+
+
+class StickerCounterTest(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.storage = RecordingStorage()
+        for user_id in (1, 2):
+            await self.storage.get_or_create_user(user_id, "user", "ru", "", 0)
+
+    def stickers(self, user_id: int) -> int:
+        return self.storage.users[user_id].stickers
+
+    async def test_increments_are_written_in_one_batch(self):
+        counter = StickerCounter(self.storage, max_pending=10, interval=60)
+        counter.add(1)
+        counter.add(1)
+        counter.add(2)
+        await asyncio.sleep(0)
+        self.assertEqual(self.storage.batch_ids, [])
+
+        await counter.flush()
+        self.assertEqual(len(self.storage.batch_ids), 1)
+        self.assertEqual((self.stickers(1), self.stickers(2)), (2, 1))
+        self.assertEqual(counter.stats(), {"pending": 0, "users": 0, "failed": 0, "flushes": 1})
+
+    async def test_full_batch_is_written_right_away(self):
+        counter = StickerCounter(self.storage, max_pending=2, interval=60)
+        counter.add(1)
+        counter.add(2)
+        await asyncio.sleep(0)
+        self.assertEqual((self.stickers(1), self.stickers(2)), (1, 1))
+
+    async def test_batch_is_written_after_the_interval(self):
+        counter = StickerCounter(self.storage, max_pending=10, interval=0.01)
+        counter.add(1)
+        await asyncio.sleep(0.05)
+        self.assertEqual(self.stickers(1), 1)
+        self.assertEqual(counter.pending, 0)
+
+    async def test_failed_batch_is_retried_with_its_id(self):
+        self.storage.failures = 1
+        counter = StickerCounter(self.storage, max_pending=10, interval=60)
+        counter.add(1)
+        await counter.flush()
+        self.assertEqual(len(self.storage.batch_ids), 2)
+        self.assertEqual(len(set(self.storage.batch_ids)), 1)
+        self.assertEqual(self.stickers(1), 1)
+
+    async def test_retry_of_a_written_batch_counts_once(self):
+        self.storage.failures = 1
+        self.storage.fail_after_write = True
+        counter = StickerCounter(self.storage, max_pending=10, interval=60)
+        counter.add(1, 3)
+        await counter.flush()
+        self.assertEqual(len(set(self.storage.batch_ids)), 1)
+        self.assertEqual(self.stickers(1), 3)
+
+    async def test_flush_keeps_what_is_not_written(self):
+        self.storage.failures = 5
+        counter = StickerCounter(self.storage, max_pending=10, interval=60)
+        counter.add(1)
+        with self.assertLogs(level="ERROR"):
+            await counter.flush(attempts=2)
+        self.assertEqual(counter.stats()["failed"], 1)
+
+        self.storage.failures = 0
+        await counter.flush()
+        self.assertEqual(self.stickers(1), 1)
+        self.assertEqual(counter.stats()["failed"], 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,64 @@
+import gzip
+import json
+import unittest
+import zlib
+
+from stickers.download import StickerTooLarge, TgsStream
+
+STICKER = json.dumps({"v": "5.5.2", "fr": 60, "layers": [{"ty": 4, "nm": "Привет"}] * 20}).encode("utf-8")
+TGS = gzip.compress(STICKER)
+
+
+def write_in_chunks(stream: TgsStream, data: bytes, size: int) -> None:
+    for i in range(0, len(data), size):
+        stream.write(data[i : i + size])
+
+
+class TgsStreamTest(unittest.TestCase):
+    def test_gzip_is_decompressed_in_any_chunks(self):
+        for size in (1, 2, 3, 64, len(TGS)):
+            stream = TgsStream()
+            write_in_chunks(stream, TGS, size)
+            self.assertEqual(stream.getvalue(), STICKER, size)
+            self.assertEqual((stream.size, stream.json_size), (len(TGS), len(STICKER)))
+
+    def test_plain_json_is_kept_as_is(self):
+        for size in (1, 2, len(STICKER)):
+            stream = TgsStream()
+            write_in_chunks(stream, STICKER, size)
+            self.assertEqual(stream.getvalue(), STICKER, size)
+
+    def test_file_shorter_than_the_gzip_header(self):
+        stream = TgsStream()
+        stream.write(b"1")
+        self.assertEqual(stream.getvalue(), b"1")
+
+    def test_file_over_the_limit(self):
+        stream = TgsStream(max_size=100)
+        with self.assertRaises(StickerTooLarge):
+            stream.expect(101)
+        with self.assertRaises(StickerTooLarge):
+            write_in_chunks(stream, TGS, 64)
+
+    def test_json_over_the_limit(self):
+        # a small file of a lot of JSON
+        bomb = gzip.compress(b" " * 1024 * 1024)
+        stream = TgsStream(max_json_size=64 * 1024)
+        with self.assertRaises(StickerTooLarge):
+            write_in_chunks(stream, bomb, 256)
+        self.assertLessEqual(stream.json_size, 64 * 1024 + 1)
+
+    def test_truncated_gzip(self):
+        stream = TgsStream()
+        stream.write(TGS[:-10])
+        with self.assertRaises(ValueError):
+            stream.getvalue()
+
+    def test_corrupt_gzip(self):
+        stream = TgsStream()
+        with self.assertRaises(zlib.error):
+            stream.write(TGS[:10] + b"\xff" * 100)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,87 @@
+import copy
+import gzip
+import io
+import json
+import os
+import random
+import unittest
+
+from benchmarks.compress import legacy_tg_compress
+from stickers.encoder import RawJSON, dump_tgs, iter_tgs_json, tg_compress
+
+FIXTURES = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "benchmarks", "fixtures", "stickers")
+
+
+def random_json(rnd: random.Random, depth: int = 4):
+    kind = rnd.random() if depth else 0
+    if kind < 0.3:
+        return rnd.choice([rnd.uniform(-1000, 1000), rnd.randint(-1000, 1000), 0.0, 1.5, True, False, None, "Привет"])
+    if kind < 0.5:
+        return [rnd.uniform(-512, 512) for _ in range(rnd.randint(0, 4))]
+    if kind < 0.75:
+        return [random_json(rnd, depth - 1) for _ in range(rnd.randint(0, 4))]
+    return {f"k{i}": random_json(rnd, depth - 1) for i in range(rnd.randint(0, 4))}
+
+
+def legacy_json(d) -> bytes:
+    """JSON the way stickers were written before the fused encoder."""
+    legacy_tg_compress(d)
+    return json.dumps(d, separators=(",", ":"), ensure_ascii=False).encode("utf-8")
+
+
+def encode(d) -> bytes:
+    output = io.BytesIO()
+    with gzip.open(output, "w") as g:
+        dump_tgs(d, g, chunk_size=8)
+    return gzip.decompress(output.getvalue())
+
+
+class EncoderTest(unittest.TestCase):
+    def assertSameAsLegacy(self, d):
+        expected = json.loads(legacy_json(copy.deepcopy(d)))
+        self.assertEqual(json.loads(encode(d)), expected)
+
+        compressed = copy.deepcopy(d)
+        tg_compress(compressed)
+        self.assertEqual(compressed, expected)
+
+    def test_random_documents_match_the_legacy_compressor(self):
+        rnd = random.Random(0)
+        for _ in range(200):
+            self.assertSameAsLegacy({"layers": random_json(rnd)})
+
+    def test_fixture_stickers_match_the_legacy_compressor(self):
+        for name in sorted(os.listdir(FIXTURES)):
+            if name.endswith(".tgs"):
+                with gzip.open(os.path.join(FIXTURES, name)) as f:
+                    self.assertSameAsLegacy(json.load(f))
+
+    def test_numbers(self):
+        self.assertEqual(encode([1.0, 0.0, 2.345, -1.239, 10, True]), b"[1,0,2.35,-1.24,10,true]")
+
+    def test_encoding_does_not_modify_the_document(self):
+        d = {"a": [1.23456, {"b": 2.34567}]}
+        encode(d)
+        self.assertEqual(d, {"a": [1.23456, {"b": 2.34567}]})
+
+    def test_raw_json_is_written_as_is(self):
+        self.assertEqual(encode({"a": RawJSON('{"b":[1.23456]}')}), b'{"a":{"b":[1.23456]}}')
+
+    def test_nesting_is_not_limited_by_recursion(self):
+        d = []
+        for _ in range(5000):
+            d = [d]
+        self.assertEqual(encode(d), b"[" * 5001 + b"]" * 5001)
+
+    def test_non_finite_floats_are_rejected(self):
+        for value in (float("nan"), float("inf"), float("-inf")):
+            with self.assertRaises(ValueError):
+                "".join(iter_tgs_json({"a": [1.0, value]}))
+
+    def test_unknown_types_are_rejected(self):
+        with self.assertRaises(TypeError):
+            "".join(iter_tgs_json({"a": object()}))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,29 @@
+import asyncio
+import os
+import unittest
+
+# users of the handlers are kept in memory, the database is not needed
+os.environ.setdefault("STORAGE_BACKEND", "memory")
+
+from aiogram import Bot, Dispatcher  # noqa: E402
+
+from handlers import register_handlers  # noqa: E402
+
+
+class RegisterHandlersTest(unittest.TestCase):
+    def test_registering_twice_adds_no_handlers(self):
+        dp = Dispatcher(Bot(token="1700000000:test", validate_token=False))
+        loop = asyncio.new_event_loop()
+        try:
+            loop.run_until_complete(register_handlers(dp))
+            count = len(dp.message_handlers.handlers)
+            loop.run_until_complete(register_handlers(dp))
+        finally:
+            loop.close()
+
+        self.assertEqual(count, 4)
+        self.assertEqual(len(dp.message_handlers.handlers), count)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,85 @@
+import os
+import tempfile
+import unittest
+
+from utils.storage import MemoryStorage, SqliteStorage, UserRow, UserStorage
+
+
+class StorageConformance(object):
+    """Behaviour every :class:`UserStorage` backend has, mixed into a test case that sets ``self.storage``."""
+
+    async def test_missing_user(self):
+        self.assertIsNone(await self.storage.get_user(1))
+
+    async def test_get_or_create_user(self):
+        created = await self.storage.get_or_create_user(1, "user", "ru", "ref", 1616600000)
+        self.assertEqual(tuple(created), (1, "user", "ru", "ref", 1616600000, 0))
+        self.assertEqual(created.stickers, 0)
+
+        # an existing user keeps its values
+        again = await self.storage.get_or_create_user(1, "renamed", "en", "", 0)
+        self.assertEqual(tuple(again), tuple(created))
+        self.assertEqual(tuple(await self.storage.get_user(1)), tuple(created))
+
+    async def test_add_stickers(self):
+        await self.storage.get_or_create_user(1, "one", "ru", "", 0)
+        await self.storage.get_or_create_user(2, "two", "ru", "", 0)
+        await self.storage.add_stickers({1: 2, 2: 1}, "batch-1")
+        await self.storage.add_stickers({1: 1}, "batch-2")
+
+        self.assertEqual((await self.storage.get_user(1)).stickers, 3)
+        self.assertEqual((await self.storage.get_user(2)).stickers, 1)
+
+    async def test_batch_is_applied_once(self):
+        await self.storage.get_or_create_user(1, "one", "ru", "", 0)
+        await self.storage.add_stickers({1: 2}, "batch-1")
+        await self.storage.add_stickers({1: 2}, "batch-1")
+
+        self.assertEqual((await self.storage.get_user(1)).stickers, 2)
+
+    async def test_stickers_of_missing_users_are_ignored(self):
+        await self.storage.add_stickers({1: 1}, "batch-1")
+        self.assertIsNone(await self.storage.get_user(1))
+
+    async def test_stats(self):
+        self.assertIsInstance(self.storage.stats(), dict)
+
+
+class MemoryStorageTest(StorageConformance, unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        self.storage = MemoryStorage()
+
+
+class SqliteStorageTest(StorageConformance, unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = os.path.join(directory.name, "users.sqlite3")
+        self.storage = SqliteStorage(self.path, threads=2)
+        self.addCleanup(self.storage._executor.shutdown)
+
+    async def test_users_outlive_the_storage(self):
+        await self.storage.get_or_create_user(1, "one", "ru", "", 0)
+        await self.storage.add_stickers({1: 1}, "batch-1")
+
+        storage = SqliteStorage(self.path, threads=1)
+        self.addCleanup(storage._executor.shutdown)
+        self.assertEqual(await storage.get_user(1), UserRow(1, "one", "ru", "", 0, 1))
+        # applied batch ids are kept as well
+        await storage.add_stickers({1: 1}, "batch-1")
+        self.assertEqual((await storage.get_user(1)).stickers, 1)
+
+
+class UserStorageTest(unittest.TestCase):
+    def test_backends_implement_every_operation(self):
+        class Incomplete(UserStorage):
+            async def get_user(self, user_id: int):
+                return None
+
+        with self.assertRaises(TypeError):
+            Incomplete()
+        self.assertEqual(MemoryStorage().stats(), {"users": 0})
+
+
+if __name__ == "__main__":
+    unittest.main()
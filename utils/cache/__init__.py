@@ -0,0 +1,6 @@
+from utils.cache.main import LRUCache, TTLCache
+
+__all__ = [
+    "LRUCache",
+    "TTLCache",
+]
@@ -0,0 +1,108 @@
+import threading
+import time
+from collections import OrderedDict
+
+
+class LRUCache(object):
+    """
+    Thread-safe least-recently-used mapping bounded by item count and, optionally, by total weight.
+
+    Weight is whatever the caller passes to :meth:`put` (usually a size in bytes),
+    items without an explicit weight count as 1.
+    """
+
+    def __init__(self, max_size: int = 128, max_weight: int = None) -> None:
+        self.max_size = max_size
+        self.max_weight = max_weight
+        self.weight = 0
+        self.hits = 0
+        self.misses = 0
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._data)
+
+    def __contains__(self, key):
+        return key in self._data
+
+    def get(self, key, default=None):
+        with self._lock:
+            try:
+                value, _ = self._data[key]
+            except KeyError:
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key, value, weight: int = 1) -> None:
+        with self._lock:
+            if key in self._data:
+                self.weight -= self._data.pop(key)[1]
+            if self.max_weight is not None and weight > self.max_weight:
+                return
+            self._data[key] = (value, weight)
+            self.weight += weight
+            while len(self._data) > self.max_size or (self.max_weight is not None and self.weight > self.max_weight):
+                _, (_, evicted_weight) = self._data.popitem(last=False)
+                self.weight -= evicted_weight
+
+    def pop(self, key, default=None):
+        with self._lock:
+            try:
+                value, weight = self._data.pop(key)
+            except KeyError:
+                return default
+            self.weight -= weight
+            return value
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+            self.weight = 0
+
+    def stats(self) -> dict:
+        return {
+            "size": len(self._data),
+            "weight": self.weight,
+            "hits": self.hits,
+            "misses": self.misses,
+        }
+
+
+class TTLCache(LRUCache):
+    """:class:`LRUCache` whose items also expire ``ttl`` seconds after they were put."""
+
+    def __init__(self, max_size: int = 128, ttl: float = 60, max_weight: int = None) -> None:
+        super().__init__(max_size=max_size, max_weight=max_weight)
+        self.ttl = ttl
+        self.expired = 0
+
+    def get(self, key, default=None):
+        item = super().get(key)
+        if item is None:
+            return default
+        value, expires_at = item
+        if expires_at < time.monotonic():
+            with self._lock:
+                # counted as a hit by the base class
+                self.hits -= 1
+                self.misses += 1
+                self.expired += 1
+            self.pop(key)
+            return default
+        return value
+
+    def put(self, key, value, weight: int = 1) -> None:
+        super().put(key, (value, time.monotonic() + self.ttl), weight=weight)
+
+    def pop(self, key, default=None):
+        item = super().pop(key)
+        return default if item is None else item[0]
+
+    def stats(self) -> dict:
+        stats = super().stats()
+        stats["expired"] = self.expired
+        return stats
@@ -0,0 +1,55 @@
+"""
+JSON codec used for webhook updates, webhook responses and source stickers.
+
+The fastest installed library is used: orjson, ujson or the standard json module.
+``JSON_CODEC`` (``orjson``, ``ujson`` or ``json``) picks one explicitly.
+"""
+import json
+import os
+
+CODECS = ("orjson", "ujson", "json")
+
+
+def _orjson():
+    import orjson
+
+    def dumps(obj) -> str:
+        return orjson.dumps(obj).decode("utf-8")
+
+    return orjson.loads, dumps
+
+
+def _ujson():
+    import ujson
+
+    def dumps(obj) -> str:
+        return ujson.dumps(obj, ensure_ascii=False, escape_forward_slashes=False)
+
+    return ujson.loads, dumps
+
+
+def _json():
+    def dumps(obj) -> str:
+        return json.dumps(obj, ensure_ascii=False, separators=(",", ":"))
+
+    return json.loads, dumps
+
+
+_FACTORIES = {"orjson": _orjson, "ujson": _ujson, "json": _json}
+
+
+def load_codec(name: str = None):
+    """Returns ``(name, loads, dumps)`` of the codec ``name``, or of the first available one."""
+    if name and name not in CODECS:
+        raise ValueError(f"Unknown JSON codec {name!r}, expected one of {CODECS}")
+    names = [name] if name else CODECS
+    for candidate in names:
+        try:
+            loads, dumps = _FACTORIES[candidate]()
+        except ImportError:
+            continue
+        return candidate, loads, dumps
+    raise ImportError(f"JSON codec {name!r} is not installed")
+
+
+NAME, loads, dumps = load_codec(os.environ.get("JSON_CODEC"))
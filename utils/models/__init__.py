@@ -1,5 +1,9 @@
+from utils.models.counters import StickerCounter, flush_counters, sticker_counter
 from utils.models.users import Users
 
 __all__ = [
+    "StickerCounter",
     "Users",
+    "flush_counters",
+    "sticker_counter",
 ]
@@ -0,0 +1,104 @@
+import asyncio
+import logging
+import os
+import uuid
+import weakref
+from collections import defaultdict
+
+from utils import tracing
+from utils.storage import UserStorage
+
+# storage -> its counter
+_counters = weakref.WeakKeyDictionary()
+
+
+class StickerCounter(object):
+    """
+    Write-behind counter of generated stickers.
+
+    Increments are summed per user in memory and written with a single query per batch:
+    once ``max_pending`` stickers are waiting, ``interval`` seconds after the first of them
+    or when :meth:`flush` is called (end of an invocation, shutdown).
+    A failed batch is kept and retried as it is with the next write. Every batch has an id the storage
+    applies only once, so a retry of a batch that was in fact written (e.g. after a timeout) does not count twice.
+    """
+
+    def __init__(self, storage: UserStorage, max_pending: int = None, interval: float = None) -> None:
+        self.storage = storage
+        self.max_pending = max_pending or int(os.environ.get("STICKER_COUNTER_BATCH", 100))
+        self.interval = interval if interval is not None else float(os.environ.get("STICKER_COUNTER_INTERVAL", 5))
+        self.pending = 0
+        self.flushes = 0
+        self._increments = defaultdict(int)
+        # (batch id, increments) that failed to be written
+        self._failed = []
+        self._timer = None
+        self._tasks = set()
+
+    def add(self, user_id: int, count: int = 1) -> None:
+        self._increments[int(user_id)] += count
+        self.pending += count
+        if self.pending >= self.max_pending:
+            self._flush_later()
+        elif self._timer is None:
+            self._timer = asyncio.get_event_loop().call_later(self.interval, self._flush_later)
+
+    def _flush_later(self) -> None:
+        task = asyncio.ensure_future(self._write())
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def flush(self, attempts: int = 3) -> None:
+        """
+        Writes all pending increments, batches already being written included.
+
+        Failed batches are retried up to ``attempts`` times, what is left after that is logged and kept.
+        """
+        for _ in range(attempts):
+            if self._tasks:
+                await asyncio.gather(*list(self._tasks), return_exceptions=True)
+            await self._write()
+            if not self._tasks and not self._increments and not self._failed:
+                return
+        logging.error(f"Sticker counters are not written: {self.stats()}")
+
+    async def _write(self) -> None:
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+
+        batches, self._failed = self._failed, []
+        if self._increments:
+            batches.append((uuid.uuid4().hex, dict(self._increments)))
+            self._increments = defaultdict(int)
+            self.pending = 0
+
+        for batch_id, increments in batches:
+            try:
+                with tracing.span("db.add_stickers"):
+                    await self.storage.add_stickers(increments, batch_id)
+                self.flushes += 1
+            except Exception as e:
+                logging.error(e)
+                self._failed.append((batch_id, increments))
+
+    def stats(self) -> dict:
+        return {
+            "pending": self.pending,
+            "users": len(self._increments),
+            "failed": sum(sum(increments.values()) for _, increments in self._failed),
+            "flushes": self.flushes,
+        }
+
+
+def sticker_counter(storage: UserStorage) -> StickerCounter:
+    """Returns the counter writing to ``storage``."""
+    counter = _counters.get(storage)
+    if counter is None:
+        counter = _counters[storage] = StickerCounter(storage)
+    return counter
+
+
+async def flush_counters() -> None:
+    """Flushes counters of all storages, call it before the process or the invocation ends."""
+    await asyncio.gather(*[counter.flush() for counter in list(_counters.values())])
@@ -1,8 +1,8 @@
-import os
 from datetime import datetime
 
-from kikimr.public.sdk.python import client as ydb
-from utils.storage import Storage
+from utils import tracing
+from utils.models.counters import sticker_counter
+from utils.storage import UserStorage
 
 
 class Users(object):
@@ -16,7 +16,7 @@ class Users(object):
         refferal: str = "",
         created_at: datetime = datetime.utcnow(),
         stickers: int = 0,
-        storage: Storage = None,
+        storage: UserStorage = None,
     ):
 
         self._storage = storage
@@ -25,86 +25,48 @@ class Users(object):
 
             self._storage = storage
 
-        query = f"""
-            PRAGMA TablePathPrefix("{storage._full_path}");
-            DECLARE $user_id AS Uint64;
-            SELECT * FROM users WHERE user_id = $user_id;
-            """
+        self.user_id = user_id
+        self.username = username
+        self.lang = lang
+        self.refferal = refferal
+        self.created_at = created_at
+        self.stickers = stickers
 
-        parameters = {"$user_id": user_id}
-
-        result = self._storage.transaction(query=query, parameters=parameters)
-        if isinstance(result, ydb.SchemeError) and result.issues[0].issues[0].issues[0].message.startswith(
-            "Cannot find table"
-        ):
-            self.__create_table()
-            del result
-            result = self._storage.transaction(query=query, parameters=parameters)[0].rows
-
-        else:
-            result = result[0].rows
-
-        if len(result) == 0:
-            query2 = f"""
-                PRAGMA TablePathPrefix("{self._storage._full_path}");
-                DECLARE $user_id AS Uint64;
-                DECLARE $username AS Utf8;
-                DECLARE $lang AS Utf8;
-                DECLARE $refferal AS Utf8;
-                DECLARE $created_at AS DateTime;
-                DECLARE $stickers AS Int64;
-                INSERT INTO users (user_id, username, lang, refferal, created_at, stickers) VALUES
-                ($user_id, $username, $lang, $refferal, $created_at, $stickers);
-                """
-
-            parameters2 = {
-                "$user_id": int(user_id),
-                "$username": username,
-                "$lang": lang,
-                "$refferal": refferal if refferal is not None else "",
-                "$created_at": int(datetime.utcnow().timestamp()),
-                "$stickers": 0,
-            }
-
-            self._storage.transaction(query=query2, parameters=parameters2)
-
-            result = self._storage.transaction(query=query, parameters=parameters)[0].rows
-
-        r = result[0]
-        self.user_id = r.user_id
-        self.username = r.username
-        self.lang = r.lang
-        self.refferal = r.refferal
-        self.created_at = datetime.fromtimestamp(r.created_at)
-        self.stickers = r.stickers
-
-    def __create_table(self):
-        def make_transaction(session: ydb.Session):
-            return session.create_table(
-                os.path.join(self._storage._full_path, "users"),
-                ydb.TableDescription()
-                .with_column(ydb.Column("user_id", ydb.OptionalType(ydb.PrimitiveType.Uint64)))
-                .with_column(ydb.Column("username", ydb.OptionalType(ydb.PrimitiveType.Utf8)))
-                .with_column(ydb.Column("lang", ydb.OptionalType(ydb.PrimitiveType.Utf8)))
-                .with_column(ydb.Column("refferal", ydb.OptionalType(ydb.PrimitiveType.Utf8)))
-                .with_column(ydb.Column("created_at", ydb.OptionalType(ydb.PrimitiveType.Datetime)))
-                .with_column(ydb.Column("stickers", ydb.OptionalType(ydb.PrimitiveType.Int64)))
-                .with_primary_key("user_id"),
-            )
-
-        self._storage.session_pool.retry_operation_sync(make_transaction)
-
-    def stickers_count_incr(self) -> None:
-        query = f"""
-            PRAGMA TablePathPrefix("{self._storage._full_path}");
-            DECLARE $user_id AS Uint64;
-            UPDATE users
-            SET stickers  = stickers + 1
-            WHERE user_id = $user_id;
-            """
-        parameters = {
-            "$user_id": int(self.user_id),
-        }
-
-        self._storage.transaction(query=query, parameters=parameters)
+    @classmethod
+    async def load(
+        cls,
+        user_id: int,
+        username: str = "",
+        lang: str = "ru",
+        refferal: str = "",
+        storage: UserStorage = None,
+    ) -> "Users":
+        """Reads the user from the database, creating them first if needed."""
+        user = cls(user_id=user_id, username=username, lang=lang, refferal=refferal, storage=storage)
+        storage = user._storage
+
+        with tracing.span("db.get_user"):
+            r = await storage.get_user(user_id)
+        if r is None:
+            with tracing.span("db.get_or_create_user"):
+                r = await storage.get_or_create_user(
+                    user_id=int(user_id),
+                    username=username,
+                    lang=lang,
+                    refferal=refferal if refferal is not None else "",
+                    created_at=int(datetime.utcnow().timestamp()),
+                )
+
+        user.user_id = r.user_id
+        user.username = r.username
+        user.lang = r.lang
+        user.refferal = r.refferal
+        user.created_at = datetime.fromtimestamp(r.created_at)
+        user.stickers = r.stickers
+        return user
+
+    async def stickers_count_incr(self) -> None:
+        # written in batches by the counter, see utils.models.counters
+        sticker_counter(self._storage).add(self.user_id)
+        # the object may be cached by UserMiddleware, keep it in line with the database
         self.stickers += 1
@@ -0,0 +1,35 @@
+"""
+Cold start timings.
+
+Import and initialization steps wrapped in :func:`timed` are recorded and logged once
+by :func:`report`, together with the time since this module was imported.
+For a per-module import breakdown run the entry point with ``python -X importtime``.
+"""
+import logging
+import time
+from contextlib import contextmanager
+
+started = time.perf_counter()
+# (step, seconds) in the order the steps finished
+timings = []
+_reported = False
+
+
+@contextmanager
+def timed(name: str):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings.append((name, time.perf_counter() - start))
+
+
+def report() -> None:
+    """Logs the recorded timings, only the first call does anything."""
+    global _reported
+    if _reported:
+        return
+    _reported = True
+
+    steps = ", ".join(f"{name} {seconds * 1000:.0f} ms" for name, seconds in timings)
+    logging.info(f"Cold start took {(time.perf_counter() - started) * 1000:.0f} ms: {steps}")
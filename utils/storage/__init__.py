@@ -1,5 +1,17 @@
+from utils.storage.backends import BACKENDS, storage_from_env
+from utils.storage.base import UserRow, UserStorage
 from utils.storage.main import Storage
+from utils.storage.memory import MemoryStorage
+from utils.storage.queries import Query
+from utils.storage.sqlite import SqliteStorage
 
 __all__ = [
+    "BACKENDS",
+    "MemoryStorage",
+    "Query",
+    "SqliteStorage",
     "Storage",
+    "UserRow",
+    "UserStorage",
+    "storage_from_env",
 ]
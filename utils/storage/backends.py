@@ -0,0 +1,25 @@
+import os
+
+from utils.storage.base import UserStorage
+from utils.storage.main import Storage
+from utils.storage.memory import MemoryStorage
+from utils.storage.sqlite import SqliteStorage
+
+BACKENDS = ("ydb", "memory", "sqlite")
+
+
+def storage_from_env(path: str) -> UserStorage:
+    """
+    Storage chosen by ``STORAGE_BACKEND``, one of :data:`BACKENDS` (``ydb`` by default).
+
+    ``path`` is the directory of the tables in YDB, SQLite keeps the users in ``{path}.sqlite3``
+    unless ``STORAGE_SQLITE_PATH`` is set.
+    """
+    backend = os.environ.get("STORAGE_BACKEND", "ydb")
+    if backend == "ydb":
+        return Storage(path=path)
+    if backend == "memory":
+        return MemoryStorage()
+    if backend == "sqlite":
+        return SqliteStorage(os.environ.get("STORAGE_SQLITE_PATH", f"{path}.sqlite3"))
+    raise ValueError(f"Unknown storage backend {backend!r}, expected one of {BACKENDS}")
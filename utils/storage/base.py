@@ -0,0 +1,36 @@
+from abc import ABC, abstractmethod
+from collections import namedtuple
+
+# created_at is a unix timestamp, as YDB returns Datetime columns
+UserRow = namedtuple("UserRow", ["user_id", "username", "lang", "refferal", "created_at", "stickers"])
+
+
+class UserStorage(ABC):
+    """
+    Operations on the users table that :mod:`utils.models` needs, implemented by every storage backend.
+
+    Rows are returned as objects with the :class:`UserRow` attributes.
+    """
+
+    def start(self) -> None:
+        """Prepares connections in the background, if the backend has any."""
+
+    @abstractmethod
+    async def get_user(self, user_id: int):
+        """Returns the row of the user, None if there is no such user."""
+
+    @abstractmethod
+    async def get_or_create_user(self, user_id: int, username: str, lang: str, refferal: str, created_at: int):
+        """Returns the row of the user, inserting it with the given values (and no stickers) if it is missing."""
+
+    @abstractmethod
+    async def add_stickers(self, increments: dict, batch_id: str) -> None:
+        """
+        Adds ``increments`` (user_id -> count) to the sticker counters of existing users in one write.
+
+        A batch is applied once: calling it again with the same ``batch_id`` changes nothing,
+        so a batch whose outcome is unknown (e.g. a timeout) can be retried.
+        """
+
+    def stats(self) -> dict:
+        return {}
@@ -1,12 +1,29 @@
+import asyncio
+import functools
 import logging
 import os
+import threading
+import time
 import traceback
+from concurrent.futures import ThreadPoolExecutor
 
 from kikimr.public.sdk.python import client as ydb
 from kikimr.public.sdk.python.iam import ServiceAccountCredentials
+from utils.startup import timed
+from utils.storage.base import UserStorage
+from utils.storage.queries import ADD_STICKERS, GET_OR_CREATE_USER, SELECT_USER, Query
 
 
-class Storage(object):
+class Storage(UserStorage):
+    """
+    YDB storage, the users are kept in the ``users`` table under ``path`` in the database.
+
+    Queries run in a pool of ``pool_size`` sessions (the number of storage threads by default, more could not
+    be used at once). ``pool_min_idle`` of them are created together with the pool and kept open while idle,
+    so the first queries of an instance do not wait for session creation. :meth:`start` does that in the background.
+    ``keep_alive`` is the gRPC keep-alive timeout of the connection in seconds.
+    """
+
     def __init__(
         self,
         *,
@@ -16,6 +33,11 @@ class Storage(object):
         account_id: str = None,
         key_id: str = None,
         private_key: str = None,
+        threads: int = None,
+        pool_size: int = None,
+        pool_workers: int = None,
+        pool_min_idle: int = None,
+        keep_alive: float = None,
     ) -> None:
 
         self._endpoint = endpoint
@@ -38,30 +60,227 @@ class Storage(object):
         if not self._private_key:
             self._private_key = os.environ.get("YC_PRIVATE_KEY")
 
-        self._driver_config = self.make_driver_config()
         self._full_path: str = os.path.join(self._database, path)
 
-        self.session_pool = self.session_pool_maker(self._driver_config)
+        threads = threads or int(os.environ.get("DB_THREADS", 4))
+        self.pool_size = pool_size or int(os.environ.get("DB_POOL_SIZE", threads))
+        self.pool_workers = pool_workers or int(os.environ.get("DB_POOL_WORKERS", 2))
+        self.pool_min_idle = min(
+            pool_min_idle if pool_min_idle is not None else int(os.environ.get("DB_POOL_MIN_IDLE", self.pool_size)),
+            self.pool_size,
+        )
+        self.keep_alive = keep_alive if keep_alive is not None else float(os.environ.get("DB_KEEP_ALIVE", 60))
+
+        # the driver connects on first use or on start, see session_pool
+        self._session_pool = None
+        self._session_pool_lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+        self.checkouts = 0
+        self.wait_time = 0.0
+        self.max_wait_time = 0.0
+        self.retries = 0
+        self.prepare_hits = 0
+        self.prepare_misses = 0
+
+        # query name -> text with the table path prefix substituted
+        self._queries = {}
+
+        # the SDK only offers blocking retries, coroutines run them here instead of on the event loop
+        self._executor = ThreadPoolExecutor(max_workers=threads, thread_name_prefix="storage")
+
+    @property
+    def session_pool(self) -> ydb.SessionPool:
+        """Session pool, the driver is created and connected on first access. Blocks, keep it off the event loop."""
+        if self._session_pool is None:
+            with self._session_pool_lock:
+                if self._session_pool is None:
+                    with timed("storage connect"):
+                        self._session_pool = self.session_pool_maker(self.make_driver_config())
+        return self._session_pool
+
+    def start(self) -> None:
+        """Connects and creates the idle sessions in a storage thread, without waiting for it."""
+        self._executor.submit(lambda: self.session_pool).add_done_callback(self._log_start_error)
+
+    @staticmethod
+    def _log_start_error(future) -> None:
+        if future.exception() is not None:
+            logging.error(future.exception())
+
+    async def run(self, func, *args, **kwargs):
+        """Calls blocking ``func`` in the storage thread pool and waits for it without blocking the loop."""
+        loop = asyncio.get_event_loop()
+        return await loop.run_in_executor(self._executor, functools.partial(func, *args, **kwargs))
+
+    async def transaction(self, query, parameters={}, mode=None):
+        return await self.run(self.transaction_sync, query, parameters, mode)
+
+    async def retry_operation(self, callee, *args, **kwargs):
+        return await self.run(self.retry_operation_sync, callee, *args, **kwargs)
+
+    def retry_operation_sync(self, callee, *args, **kwargs):
+        """
+        Calls ``callee(session, *args, **kwargs)`` with a session of the pool, retrying as the SDK does.
+
+        Counts the time spent waiting for a session and the retries for :meth:`stats`.
+        """
+        pool = self.session_pool
+        retry_settings = ydb.RetrySettings()
+        attempts = 0
+
+        def wrapped_callee():
+            nonlocal attempts
+            attempts += 1
+            started = time.perf_counter()
+            with pool.checkout(timeout=retry_settings.get_session_client_timeout) as session:
+                self._count_checkout(time.perf_counter() - started)
+                return callee(session, *args, **kwargs)
+
+        try:
+            return ydb.retry_operation_sync(wrapped_callee, retry_settings)
+        finally:
+            if attempts > 1:
+                with self._stats_lock:
+                    self.retries += attempts - 1
+
+    def _count_checkout(self, wait_time: float) -> None:
+        with self._stats_lock:
+            self.checkouts += 1
+            self.wait_time += wait_time
+            self.max_wait_time = max(self.max_wait_time, wait_time)
+
+    def query_text(self, query) -> str:
+        """Returns YQL text of a :class:`Query` (rendered on first use) or of a plain string query."""
+        if not isinstance(query, Query):
+            return query
+        text = self._queries.get(query.name)
+        if text is None:
+            text = self._queries[query.name] = query.template.format(path=self._full_path)
+        return text
+
+    def prepare(self, session: ydb.Session, query):
+        """Prepares ``query`` in ``session``, the session keeps its prepared queries itself."""
+        text = self.query_text(query)
+        # the same lookup session.prepare does first, a miss costs a round trip
+        prepared_query, _ = session._state.lookup(text)
+        with self._stats_lock:
+            if prepared_query is None:
+                self.prepare_misses += 1
+            else:
+                self.prepare_hits += 1
+        return session.prepare(text)
+
+    def transaction_sync(self, query, parameters={}, mode=None):
+        """Executes ``query`` in a single transaction, serializable unless another ``mode`` is given."""
 
-    def transaction(self, query, parameters={}):
         def make_transaction(session: ydb.Session):
-            tx = session.transaction(ydb.SerializableReadWrite()).begin()
             try:
-                prepared_query = session.prepare(query)
+                prepared_query = self.prepare(session, query)
             except Exception as e:
                 return e
-            return tx.execute(
+            # the transaction is begun by the execute request itself, no separate round trip for it
+            return session.transaction(mode or ydb.SerializableReadWrite()).execute(
                 prepared_query,
                 parameters=parameters,
                 commit_tx=True,
             )
 
-        return self.session_pool.retry_operation_sync(make_transaction)
+        return self.retry_operation_sync(make_transaction)
+
+    async def get_user(self, user_id: int):
+        # known users only need a read, a slightly stale one is fine and cheaper
+        result = await self.transaction(query=SELECT_USER, parameters={"$user_id": user_id}, mode=ydb.StaleReadOnly())
+        if self._missing_table(result):
+            await self.create_users_table()
+            return None
+        rows = result[0].rows
+        return rows[0] if rows else None
+
+    async def get_or_create_user(self, user_id: int, username: str, lang: str, refferal: str, created_at: int):
+        parameters = {
+            "$user_id": int(user_id),
+            "$username": username,
+            "$lang": lang,
+            "$refferal": refferal,
+            "$created_at": created_at,
+        }
+        return (await self.transaction(query=GET_OR_CREATE_USER, parameters=parameters))[0].rows[0]
+
+    async def add_stickers(self, increments: dict, batch_id: str) -> None:
+        parameters = {
+            "$batch_id": batch_id,
+            "$applied_at": int(time.time()),
+            "$increments": [{"user_id": user_id, "added": count} for user_id, count in increments.items()],
+        }
+        result = await self.transaction(query=ADD_STICKERS, parameters=parameters)
+        if self._missing_table(result):
+            # created after the users table, by a version that did not have it
+            await self.create_batches_table()
+            result = await self.transaction(query=ADD_STICKERS, parameters=parameters)
+        if isinstance(result, Exception):
+            raise result
+
+    @staticmethod
+    def _missing_table(result) -> bool:
+        return isinstance(result, ydb.SchemeError) and result.issues[0].issues[0].issues[0].message.startswith(
+            "Cannot find table"
+        )
+
+    async def create_users_table(self) -> None:
+        def make_transaction(session: ydb.Session):
+            return session.create_table(
+                os.path.join(self._full_path, "users"),
+                ydb.TableDescription()
+                .with_column(ydb.Column("user_id", ydb.OptionalType(ydb.PrimitiveType.Uint64)))
+                .with_column(ydb.Column("username", ydb.OptionalType(ydb.PrimitiveType.Utf8)))
+                .with_column(ydb.Column("lang", ydb.OptionalType(ydb.PrimitiveType.Utf8)))
+                .with_column(ydb.Column("refferal", ydb.OptionalType(ydb.PrimitiveType.Utf8)))
+                .with_column(ydb.Column("created_at", ydb.OptionalType(ydb.PrimitiveType.Datetime)))
+                .with_column(ydb.Column("stickers", ydb.OptionalType(ydb.PrimitiveType.Int64)))
+                .with_primary_key("user_id"),
+            )
+
+        await self.retry_operation(make_transaction)
+        await self.create_batches_table()
+
+    async def create_batches_table(self) -> None:
+        """Ids of the applied sticker counter batches, see ADD_STICKERS."""
+
+        def make_transaction(session: ydb.Session):
+            return session.create_table(
+                os.path.join(self._full_path, "sticker_batches"),
+                ydb.TableDescription()
+                .with_column(ydb.Column("batch_id", ydb.OptionalType(ydb.PrimitiveType.Utf8)))
+                .with_column(ydb.Column("applied_at", ydb.OptionalType(ydb.PrimitiveType.Datetime)))
+                .with_primary_key("batch_id"),
+            )
+
+        await self.retry_operation(make_transaction)
+
+    def stats(self) -> dict:
+        stats = {
+            "prepare_hits": self.prepare_hits,
+            "prepare_misses": self.prepare_misses,
+            "checkouts": self.checkouts,
+            "wait_ms": round(self.wait_time * 1000, 2),
+            "max_wait_ms": round(self.max_wait_time * 1000, 2),
+            "retries": self.retries,
+        }
+        pool = self._session_pool
+        if pool is not None:
+            stats.update(
+                sessions=pool.active_size,
+                in_use=pool.busy_size,
+                idle=pool.free_size,
+                waiters=pool.waiters_count,
+            )
+        return stats
 
     def make_driver_config(self):
         return ydb.DriverConfig(
             self._endpoint,
             self._database,
+            grpc_keep_alive_timeout=int(self.keep_alive * 1000),
             credentials=ServiceAccountCredentials(
                 service_account_id=self._account_id,
                 access_key_id=self._key_id,
@@ -71,7 +290,7 @@ class Storage(object):
             ),
         )
 
-    def session_pool_maker(self, driver_config: ydb.DriverConfig, size=1, workers_threads_count=1):
+    def session_pool_maker(self, driver_config: ydb.DriverConfig):
         driver = ydb.Driver(driver_config)
         try:
             logging.info("connecting to the database")
@@ -84,4 +303,20 @@ class Storage(object):
             traceback.print_exc(file=logf)
             logf.close()
             raise
-        return ydb.SessionPool(driver, size=size, workers_threads_count=workers_threads_count)
\ No newline at end of file
+        pool = ydb.SessionPool(
+            driver,
+            size=self.pool_size,
+            workers_threads_count=self.pool_workers,
+            min_pool_size=self.pool_min_idle,
+        )
+        # the pool starts creating its minimum of sessions, wait until they are ready
+        sessions = []
+        try:
+            for _ in range(self.pool_min_idle):
+                sessions.append(pool.acquire(timeout=5))
+        except ydb.Error as e:
+            # the queries create sessions on demand then
+            logging.error(e)
+        for session in sessions:
+            pool.release(session)
+        return pool
@@ -0,0 +1,32 @@
+from utils.cache import LRUCache
+from utils.storage.base import UserRow, UserStorage
+
+
+class MemoryStorage(UserStorage):
+    """Users in a dict of the process, for local runs and benchmarks. Nothing outlives the process."""
+
+    def __init__(self) -> None:
+        self.users = {}
+        # ids of the applied batches, retries come soon after the first attempt
+        self.batches = LRUCache(max_size=1024)
+
+    async def get_user(self, user_id: int):
+        return self.users.get(user_id)
+
+    async def get_or_create_user(self, user_id: int, username: str, lang: str, refferal: str, created_at: int):
+        user = self.users.get(user_id)
+        if user is None:
+            user = self.users[user_id] = UserRow(user_id, username, lang, refferal, created_at, 0)
+        return user
+
+    async def add_stickers(self, increments: dict, batch_id: str) -> None:
+        if self.batches.get(batch_id) is not None:
+            return
+        self.batches.put(batch_id, True)
+        for user_id, count in increments.items():
+            user = self.users.get(user_id)
+            if user is not None:
+                self.users[user_id] = user._replace(stickers=user.stickers + count)
+
+    def stats(self) -> dict:
+        return {"users": len(self.users)}
@@ -0,0 +1,79 @@
+class Query(object):
+    """
+    Named YQL query template.
+
+    ``{path}`` in the template is replaced with the storage path by :class:`Storage`, once per storage.
+    """
+
+    __slots__ = ("name", "template")
+
+    def __init__(self, name: str, template: str) -> None:
+        self.name = name
+        self.template = template
+
+    def __repr__(self):
+        return f"<Query {self.name}>"
+
+
+USER_COLUMNS = "user_id, username, lang, refferal, created_at, stickers"
+
+SELECT_USER = Query(
+    "users.select",
+    f"""
+    PRAGMA TablePathPrefix("{{path}}");
+    DECLARE $user_id AS Uint64;
+    SELECT {USER_COLUMNS} FROM users WHERE user_id = $user_id;
+    """,
+)
+
+# reads the user and inserts them if missing, in one transaction.
+# The row is selected before the insert: a table can not be read after it was modified in a transaction,
+# and the named expressions read users again wherever they are used.
+GET_OR_CREATE_USER = Query(
+    "users.get_or_create",
+    f"""
+    PRAGMA TablePathPrefix("{{path}}");
+    DECLARE $user_id AS Uint64;
+    DECLARE $username AS Utf8;
+    DECLARE $lang AS Utf8;
+    DECLARE $refferal AS Utf8;
+    DECLARE $created_at AS Datetime;
+
+    $existing = (SELECT {USER_COLUMNS} FROM users WHERE user_id = $user_id);
+    $created = (
+        SELECT
+            $user_id AS user_id,
+            $username AS username,
+            $lang AS lang,
+            $refferal AS refferal,
+            $created_at AS created_at,
+            CAST(0 AS Int64) AS stickers
+        FROM (SELECT COUNT(*) AS found FROM $existing)
+        WHERE found = 0
+    );
+
+    SELECT * FROM $existing UNION ALL SELECT * FROM $created;
+    INSERT INTO users SELECT * FROM $created;
+    """,
+)
+
+# adds a batch of increments once: the batch id is recorded in the same transaction,
+# a retry of a batch that was already committed changes nothing
+ADD_STICKERS = Query(
+    "users.add_stickers",
+    """
+    PRAGMA TablePathPrefix("{path}");
+    DECLARE $batch_id AS Utf8;
+    DECLARE $applied_at AS Datetime;
+    DECLARE $increments AS List<Struct<user_id: Uint64, added: Int64>>;
+
+    $done = (SELECT COUNT(*) FROM sticker_batches WHERE batch_id = $batch_id);
+
+    UPSERT INTO users
+    SELECT u.user_id AS user_id, COALESCE(u.stickers, 0) + i.added AS stickers
+    FROM AS_TABLE($increments) AS i
+    INNER JOIN users AS u ON u.user_id = i.user_id
+    WHERE $done = 0;
+    UPSERT INTO sticker_batches (batch_id, applied_at) VALUES ($batch_id, $applied_at);
+    """,
+)
@@ -0,0 +1,109 @@
+import asyncio
+import functools
+import os
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from utils.storage.base import UserRow, UserStorage
+
+CREATE_USERS = """
+CREATE TABLE IF NOT EXISTS users (
+    user_id INTEGER PRIMARY KEY,
+    username TEXT,
+    lang TEXT,
+    refferal TEXT,
+    created_at INTEGER,
+    stickers INTEGER NOT NULL DEFAULT 0
+)
+"""
+SELECT_USER = "SELECT user_id, username, lang, refferal, created_at, stickers FROM users WHERE user_id = ?"
+INSERT_USER = (
+    "INSERT OR IGNORE INTO users (user_id, username, lang, refferal, created_at, stickers) VALUES (?, ?, ?, ?, ?, 0)"
+)
+CREATE_BATCHES = """
+CREATE TABLE IF NOT EXISTS sticker_batches (
+    batch_id TEXT PRIMARY KEY,
+    applied_at INTEGER
+)
+"""
+INSERT_BATCH = "INSERT OR IGNORE INTO sticker_batches (batch_id, applied_at) VALUES (?, ?)"
+# applied batch ids are only needed while the batch may still be retried
+DELETE_BATCHES = "DELETE FROM sticker_batches WHERE applied_at < ?"
+BATCHES_TTL = 24 * 60 * 60
+ADD_STICKERS = "UPDATE users SET stickers = stickers + ? WHERE user_id = ?"
+
+
+class SqliteStorage(UserStorage):
+    """
+    Users in a SQLite database file, for single instance deployments without a database service.
+
+    The database is in WAL mode, so reads of the worker threads do not wait for a write.
+    Every thread has its own connection, the queries run in a thread pool off the event loop.
+    """
+
+    def __init__(self, path: str, threads: int = None, timeout: float = 5) -> None:
+        self.path = path
+        self.timeout = timeout
+        self._local = threading.local()
+        self._executor = ThreadPoolExecutor(
+            max_workers=threads or int(os.environ.get("DB_THREADS", 4)),
+            thread_name_prefix="sqlite",
+        )
+        connection = self._connect()
+        try:
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute(CREATE_USERS)
+            connection.execute(CREATE_BATCHES)
+        finally:
+            connection.close()
+
+    def _connect(self) -> sqlite3.Connection:
+        connection = sqlite3.connect(self.path, timeout=self.timeout, isolation_level=None)
+        # WAL stays consistent with NORMAL, only the last commits may be lost on a power failure
+        connection.execute("PRAGMA synchronous=NORMAL")
+        return connection
+
+    @property
+    def connection(self) -> sqlite3.Connection:
+        """Connection of the current thread."""
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            connection = self._local.connection = self._connect()
+        return connection
+
+    async def run(self, func, *args):
+        loop = asyncio.get_event_loop()
+        return await loop.run_in_executor(self._executor, functools.partial(func, *args))
+
+    async def get_user(self, user_id: int):
+        return await self.run(self._get_user, user_id)
+
+    async def get_or_create_user(self, user_id: int, username: str, lang: str, refferal: str, created_at: int):
+        return await self.run(self._get_or_create_user, user_id, username, lang, refferal, created_at)
+
+    async def add_stickers(self, increments: dict, batch_id: str) -> None:
+        await self.run(self._add_stickers, increments, batch_id)
+
+    def _get_user(self, user_id: int):
+        row = self.connection.execute(SELECT_USER, (user_id,)).fetchone()
+        return UserRow(*row) if row is not None else None
+
+    def _get_or_create_user(self, user_id, username, lang, refferal, created_at):
+        connection = self.connection
+        with connection:
+            connection.execute("BEGIN IMMEDIATE")
+            connection.execute(INSERT_USER, (user_id, username, lang, refferal, created_at))
+            return UserRow(*connection.execute(SELECT_USER, (user_id,)).fetchone())
+
+    def _add_stickers(self, increments: dict, batch_id: str) -> None:
+        connection = self.connection
+        now = int(time.time())
+        with connection:
+            connection.execute("BEGIN IMMEDIATE")
+            if connection.execute(INSERT_BATCH, (batch_id, now)).rowcount == 0:
+                # already applied
+                return
+            connection.execute(DELETE_BATCHES, (now - BATCHES_TTL,))
+            connection.executemany(ADD_STICKERS, [(count, user_id) for user_id, count in increments.items()])
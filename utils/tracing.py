@@ -0,0 +1,170 @@
+"""
+Per-update stage timings.
+
+A trace is started for every update (see :class:`webhook.scheduler.DeadlineScheduler`), code on the way
+measures its stages with :func:`span`. When the update is done one structured log line
+with all its spans is written and the durations are added to process-wide aggregates:
+:func:`prometheus_text` renders them with p50/p95/p99 quantiles, and with ``STATSD_ADDRESS=host:port``
+every duration is also sent to StatsD.
+
+Enabled by ``TRACING=1``, otherwise :func:`span` hands out a shared no-op context manager.
+"""
+import contextlib
+import contextvars
+import logging
+import os
+import socket
+import threading
+import time
+from collections import deque
+
+from utils import codec
+
+ENABLED = os.environ.get("TRACING", "0") not in ("", "0")
+STATSD_ADDRESS = os.environ.get("STATSD_ADDRESS")
+STATSD_PREFIX = os.environ.get("STATSD_PREFIX", "sticker_bot")
+# durations kept per span for the quantiles
+WINDOW = int(os.environ.get("TRACING_WINDOW", 2048))
+QUANTILES = (0.5, 0.95, 0.99)
+
+_NOOP = contextlib.nullcontext()
+_current = contextvars.ContextVar("trace", default=None)
+
+
+class Trace(object):
+    """Spans of one update, name -> total nanoseconds (a stage may run several times)."""
+
+    __slots__ = ("update_id", "started", "spans")
+
+    def __init__(self, update_id=None) -> None:
+        self.update_id = update_id
+        self.started = time.perf_counter_ns()
+        self.spans = {}
+
+    def add(self, name: str, duration: int) -> None:
+        self.spans[name] = self.spans.get(name, 0) + duration
+
+    def merge(self, spans: dict) -> None:
+        for name, duration in spans.items():
+            self.add(name, duration)
+
+    def finish(self, **fields) -> None:
+        """Logs the trace and adds it to the aggregates, ``fields`` go to the log line as they are."""
+        total = time.perf_counter_ns() - self.started
+        record = {"update_id": self.update_id, "total_ms": round(total / 1e6, 2)}
+        record.update(fields)
+        record["spans_ms"] = {name: round(duration / 1e6, 2) for name, duration in self.spans.items()}
+        logging.info(f"trace {codec.dumps(record)}")
+
+        metrics.observe("update", total)
+        for name, duration in self.spans.items():
+            metrics.observe(name, duration)
+
+
+class _Span(object):
+    __slots__ = ("trace", "name", "started")
+
+    def __init__(self, trace: Trace, name: str) -> None:
+        self.trace = trace
+        self.name = name
+
+    def __enter__(self):
+        self.started = time.perf_counter_ns()
+        return self
+
+    def __exit__(self, *exc):
+        self.trace.add(self.name, time.perf_counter_ns() - self.started)
+
+
+def start(update_id=None):
+    """Starts the trace of an update in the current context, returns None when tracing is disabled."""
+    if not ENABLED:
+        return None
+    trace = Trace(update_id)
+    _current.set(trace)
+    return trace
+
+
+def current():
+    return _current.get() if ENABLED else None
+
+
+def span(name: str):
+    """Context manager adding the time spent in it to the current trace under ``name``."""
+    if not ENABLED:
+        return _NOOP
+    trace = _current.get()
+    if trace is None:
+        return _NOOP
+    return _Span(trace, name)
+
+
+class Metrics(object):
+    """Count, sum and a window of the latest durations of every span, and the registered stats as gauges."""
+
+    def __init__(self, window: int = WINDOW) -> None:
+        self.window = window
+        self._series = {}
+        # name -> function returning a dict of numbers, exported as gauges
+        self._sources = {}
+        self._lock = threading.Lock()
+        self._statsd = None
+        if STATSD_ADDRESS:
+            host, _, port = STATSD_ADDRESS.rpartition(":")
+            self._statsd = (socket.socket(socket.AF_INET, socket.SOCK_DGRAM), (host, int(port)))
+
+    def observe(self, name: str, duration: int) -> None:
+        with self._lock:
+            series = self._series.get(name)
+            if series is None:
+                series = self._series[name] = [0, 0, deque(maxlen=self.window)]
+            series[0] += 1
+            series[1] += duration
+            series[2].append(duration)
+        if self._statsd is not None:
+            sock, address = self._statsd
+            try:
+                sock.sendto(f"{STATSD_PREFIX}.{name}:{duration / 1e6:.3f}|ms".encode("ascii"), address)
+            except OSError as e:
+                logging.error(e)
+
+    def register(self, name: str, stats) -> None:
+        """Exports the numbers ``stats()`` returns (e.g. cache or pool stats) as ``sticker_bot_<name>`` gauges."""
+        self._sources[name] = stats
+
+    def summary(self) -> dict:
+        """name -> count, sum and quantiles in seconds."""
+        with self._lock:
+            series = {name: (count, total, sorted(window)) for name, (count, total, window) in self._series.items()}
+        result = {}
+        for name, (count, total, window) in series.items():
+            result[name] = {
+                "count": count,
+                "sum": total / 1e9,
+                "quantiles": {q: window[min(int(q * len(window)), len(window) - 1)] / 1e9 for q in QUANTILES},
+            }
+        return result
+
+    def prometheus_text(self) -> str:
+        lines = [
+            "# HELP sticker_bot_span_seconds Time spent in the stages of update handling.",
+            "# TYPE sticker_bot_span_seconds summary",
+        ]
+        for name, stats in sorted(self.summary().items()):
+            for q, value in stats["quantiles"].items():
+                lines.append(f'sticker_bot_span_seconds{{span="{name}",quantile="{q}"}} {value:.6f}')
+            lines.append(f'sticker_bot_span_seconds_sum{{span="{name}"}} {stats["sum"]:.6f}')
+            lines.append(f'sticker_bot_span_seconds_count{{span="{name}"}} {stats["count"]}')
+        for name, stats in sorted(self._sources.items()):
+            lines.append(f"# TYPE sticker_bot_{name} gauge")
+            for key, value in sorted(stats().items()):
+                if isinstance(value, (int, float)) and not isinstance(value, bool):
+                    lines.append(f'sticker_bot_{name}{{stat="{key}"}} {value}')
+        return "\n".join(lines) + "\n"
+
+
+metrics = Metrics()
+
+
+def prometheus_text() -> str:
+    return metrics.prometheus_text()
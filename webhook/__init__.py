@@ -1,5 +1,10 @@
+from webhook.bot import WebhookBot
 from webhook.main import WebhookRequestHandler
+from webhook.scheduler import HandoffSink, MemoryHandoff
 
 __all__ = [
+    "HandoffSink",
+    "MemoryHandoff",
+    "WebhookBot",
     "WebhookRequestHandler",
 ]
@@ -0,0 +1,128 @@
+import asyncio
+import os
+
+import aiohttp
+from aiogram import Bot
+
+from utils import tracing
+from utils.cache import LRUCache
+from webhook.scheduler import api_calls
+
+CONNECTIONS_LIMIT = int(os.environ.get("TG_CONNECTIONS_LIMIT", 100))
+DNS_CACHE_TTL = int(os.environ.get("TG_DNS_CACHE_TTL", 300))
+KEEPALIVE_TIMEOUT = float(os.environ.get("TG_KEEPALIVE_TIMEOUT", 60))
+
+
+class WebhookBot(Bot):
+    """
+    :class:`aiogram.Bot` for a long living (warm) function instance.
+
+    All bots share one keep-alive HTTP session with a DNS cache, so API requests, downloads and uploads
+    of every token reuse open connections to the API server across invocations.
+    :meth:`for_token` hands out one bot per token.
+    Outbound requests of the update being handled are counted in ``api_calls``.
+    """
+
+    _shared_session = None
+    # the loop the shared session was created in
+    _session_loop = None
+    _bots = LRUCache(max_size=16)
+    connection_stats = {
+        "created": 0,
+        "reused": 0,
+        "dns_cache_hits": 0,
+        "dns_cache_misses": 0,
+    }
+
+    @classmethod
+    def for_token(cls, token: str, **kwargs) -> "WebhookBot":
+        """Returns the bot of ``token``, creating (and validating the token) on first use only."""
+        bot = cls._bots.get(token)
+        if bot is None:
+            bot = cls(token=token, **kwargs)
+            cls._bots.put(token, bot)
+        return bot
+
+    @classmethod
+    def reuse_rate(cls) -> float:
+        stats = cls.connection_stats
+        total = stats["created"] + stats["reused"]
+        return stats["reused"] / total if total else 0.0
+
+    @classmethod
+    async def close_shared_session(cls) -> None:
+        """Closes the session of all bots, e.g. on shutdown. The next request opens a new one."""
+        session, loop = WebhookBot._shared_session, WebhookBot._session_loop
+        WebhookBot._shared_session = WebhookBot._session_loop = None
+        if session is None or session.closed:
+            return
+        if loop is asyncio.get_event_loop():
+            await session.close()
+        else:
+            cls._close_in_loop(session, loop)
+
+    @staticmethod
+    def _close_in_loop(session: aiohttp.ClientSession, loop: asyncio.AbstractEventLoop) -> None:
+        """Closes ``session`` of another loop, which only that loop can do."""
+        if loop.is_closed():
+            # the connections went down with the loop, only the session is left to release
+            session.detach()
+        else:
+            asyncio.run_coroutine_threadsafe(session.close(), loop)
+
+    @property
+    def session(self) -> aiohttp.ClientSession:
+        session = WebhookBot._shared_session
+        loop = asyncio.get_event_loop()
+        # a session can only be used in the loop it was created in
+        if session is None or session.closed or WebhookBot._session_loop is not loop:
+            if session is not None and not session.closed:
+                self._close_in_loop(session, WebhookBot._session_loop)
+            session = WebhookBot._shared_session = self.get_new_session()
+            WebhookBot._session_loop = loop
+        return session
+
+    def get_new_session(self) -> aiohttp.ClientSession:
+        if self._connector_class is not aiohttp.TCPConnector:
+            # proxy connectors take their own options
+            return super().get_new_session()
+
+        return aiohttp.ClientSession(
+            connector=aiohttp.TCPConnector(
+                limit=CONNECTIONS_LIMIT,
+                ssl=self._connector_init["ssl"],
+                use_dns_cache=True,
+                ttl_dns_cache=DNS_CACHE_TTL,
+                keepalive_timeout=KEEPALIVE_TIMEOUT,
+            ),
+            trace_configs=[self._trace_config()],
+        )
+
+    @classmethod
+    def _trace_config(cls) -> aiohttp.TraceConfig:
+        def count(name):
+            async def callback(session, context, params):
+                cls.connection_stats[name] += 1
+
+            return callback
+
+        trace_config = aiohttp.TraceConfig()
+        trace_config.on_connection_create_end.append(count("created"))
+        trace_config.on_connection_reuseconn.append(count("reused"))
+        trace_config.on_dns_cache_hit.append(count("dns_cache_hits"))
+        trace_config.on_dns_cache_miss.append(count("dns_cache_misses"))
+        return trace_config
+
+    async def request(self, method, data=None, files=None, **kwargs):
+        calls = api_calls.get()
+        if calls is not None:
+            calls.add(method)
+        with tracing.span(f"tg.{method}"):
+            return await super().request(method, data, files, **kwargs)
+
+    async def download_file(self, *args, **kwargs):
+        calls = api_calls.get()
+        if calls is not None:
+            calls.add("download")
+        with tracing.span("tg.download"):
+            return await super().download_file(*args, **kwargs)
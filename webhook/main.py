@@ -1,22 +1,41 @@
 import asyncio
-import functools
 import itertools
-import json
+import logging
+import os
+import time
 
 from aiogram import types
 from aiogram.dispatcher.webhook import BaseResponse
-from aiogram.utils.exceptions import TimeoutWarning
 from aiogram import Bot, Dispatcher
-
-RESPONSE_TIMEOUT = 55
+from utils import codec
+from webhook.bot import WebhookBot
+from webhook.scheduler import DeadlineScheduler, update_chat_id
+
+# execution timeout of the function, see .github/workflows
+FUNCTION_TIMEOUT = float(os.environ.get("FUNCTION_TIMEOUT", 7))
+# handlers that take longer answer through API requests instead of the webhook response
+RESPONSE_TIMEOUT = float(os.environ.get("WEBHOOK_RESPONSE_TIMEOUT", FUNCTION_TIMEOUT - 2))
+# time the invocation needs after the drain, to flush the counters and the sticker cache
+FLUSH_RESERVE = float(os.environ.get("WEBHOOK_FLUSH_RESERVE", 1))
+# how long the invocation waits for handlers that missed RESPONSE_TIMEOUT, by default what is left of the
+# function timeout. The response is held meanwhile, so a longer drain makes Telegram resend the update.
+DRAIN_TIMEOUT = os.environ.get("WEBHOOK_DRAIN_TIMEOUT")
+DRAIN_TIMEOUT = float(DRAIN_TIMEOUT) if DRAIN_TIMEOUT else None
+# updates of a batch processed at the same time, updates of one chat are always processed one by one
+BATCH_CONCURRENCY = int(os.environ.get("WEBHOOK_BATCH_CONCURRENCY", 8))
 
 
 class WebhookRequestHandler:
-    def __init__(self, dp: Dispatcher):
+    def __init__(self, dp: Dispatcher, bot: Bot = None):
         self.dispatcher = dp
+        # bot of the token the updates came for, the dispatcher's one by default
+        self.bot = bot or dp.bot
+        # the invocation starts with the handler, the drain gets what is left of its time
+        self.started = time.monotonic()
+        self.scheduler = DeadlineScheduler(RESPONSE_TIMEOUT)
         try:
             Dispatcher.set_current(dp)
-            Bot.set_current(dp.bot)
+            Bot.set_current(self.bot)
         except RuntimeError:
             pass
 
@@ -24,10 +43,18 @@ class WebhookRequestHandler:
         """
         Read update from stream and deserialize it.
 
+        A batch of updates is either a JSON array of updates in the body
+        or a message queue trigger event with an update in the body of every message.
+
         :param event:
-        :return: :class:`aiogram.types.Update`
+        :return: :class:`aiogram.types.Update` or a list of them for a batch
         """
-        data = json.loads(event["body"])
+        if "messages" in event:
+            return [types.Update.to_object(codec.loads(m["details"]["message"]["body"])) for m in event["messages"]]
+
+        data = codec.loads(event["body"])
+        if isinstance(data, list):
+            return [types.Update.to_object(item) for item in data]
         update = types.Update.to_object(data)
         return update
 
@@ -38,85 +65,149 @@ class WebhookRequestHandler:
         if one of handler returns instance of :class:`aiogram.dispatcher.webhook.BaseResponse` return it to webhook.
         Otherwise do nothing (return 'ok')
 
+        A batch of updates (see :meth:`parse_update`) is processed by :meth:`post_batch`.
+
         :return: :dict:
         """
 
         update = await self.parse_update(event)
+        if isinstance(update, list):
+            return await self.post_batch(update)
 
         results = await self.process_update(update)
         response = self.get_response(results)
+        body = codec.dumps(response.get_response()) if response else "ok"
+        if response is not None:
+            # the reply leaves with the body of this invocation
+            await self.response_sent(response)
+        await self.finish()
 
         return {
             "headers": {
                 "Content-Type": "application/json",
             },
             "statusCode": 200,
-            "body": json.dumps(response.get_response()) if response else "ok",
+            "body": body,
         }
 
+    async def post_batch(self, updates: list, concurrency: int = None):
+        """
+        Process a batch of updates.
+
+        Webhook can answer with a single method only, so responses of the handlers are sent via API requests.
+
+        :return: :dict: with a JSON list of results, one per update in the order of ``updates``
+        """
+        results = await self.process_updates(updates, concurrency or BATCH_CONCURRENCY)
+        await self.finish()
+        return {
+            "headers": {
+                "Content-Type": "application/json",
+            },
+            "statusCode": 200,
+            "body": codec.dumps(results),
+        }
+
+    async def process_updates(self, updates: list, concurrency: int):
+        """
+        Process updates concurrently, up to ``concurrency`` chats at a time, updates of one chat in their order.
+
+        :return: list of ``{"update_id": ..., "ok": ...}`` in the order of ``updates``
+        """
+        chats = {}
+        for index, update in enumerate(updates):
+            chat_id = update_chat_id(update)
+            # updates without a chat do not depend on each other
+            chats.setdefault(chat_id if chat_id is not None else ("update", index), []).append((index, update))
+
+        results = [None] * len(updates)
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def process_chat(chat_updates):
+            async with semaphore:
+                for index, update in chat_updates:
+                    results[index] = await self.process_batch_update(update)
+
+        await asyncio.gather(*[process_chat(chat_updates) for chat_updates in chats.values()])
+        return results
+
+    async def process_batch_update(self, update):
+        try:
+            response = self.get_response(await self.process_update(update))
+            if response is not None:
+                await response.execute_response(self.bot)
+                await self.response_sent(response)
+        except Exception as e:
+            logging.error(e)
+            return {"update_id": update.update_id, "ok": False, "error": str(e)}
+        return {"update_id": update.update_id, "ok": True, "late": update.update_id in self.scheduler.overdue}
+
     async def process_update(self, update):
         """
-        Need respond in less than 60 seconds in to webhook.
+        Need respond in less than RESPONSE_TIMEOUT seconds in to webhook.
 
-        So... If you respond greater than 55 seconds webhook automatically respond 'ok'
+        So... If you respond later, webhook automatically respond 'ok'
         and execute callback response via simple HTTP request.
 
         :param update:
-        :return:
+        :return: results of the handlers or None if they did not finish in time
         """
-        dispatcher = self.dispatcher
-        loop = dispatcher.loop or asyncio.get_event_loop()
-
-        # Analog of `asyncio.wait_for` but without cancelling task
-        waiter = loop.create_future()
-        timeout_handle = loop.call_later(RESPONSE_TIMEOUT, asyncio.tasks._release_waiter, waiter)
-        cb = functools.partial(asyncio.tasks._release_waiter, waiter)
+        return await self.scheduler.run(
+            update, self.dispatcher.updates_handler.notify(update), self.respond_via_request
+        )
 
-        fut = asyncio.ensure_future(dispatcher.updates_handler.notify(update), loop=loop)
-        fut.add_done_callback(cb)
+    async def respond_via_request(self, update, task):
+        """
+        Handle response after RESPONSE_TIMEOUT seconds.
 
-        try:
-            try:
-                await waiter
-            except asyncio.CancelledError:
-                fut.remove_done_callback(cb)
-                fut.cancel()
-                raise
-
-            if fut.done():
-                return fut.result()
-            else:
-                # context.set_value(WEBHOOK_CONNECTION, False)
-                fut.remove_done_callback(cb)
-                fut.add_done_callback(self.respond_via_request)
-        finally:
-            timeout_handle.cancel()
-
-    def respond_via_request(self, task):
-        """
-        Handle response after 55 second.
-
-        :param task:
+        :param update:
+        :param task: finished task of the handlers
         :return:
         """
-        print(
+        logging.warning(
             f"Detected slow response into webhook. "
             f"(Greater than {RESPONSE_TIMEOUT} seconds)\n"
-            f"Recommended to use 'async_task' decorator from Dispatcher for handler with long timeouts.",
-            TimeoutWarning,
+            f"Recommended to use 'async_task' decorator from Dispatcher for handler with long timeouts."
         )
 
         dispatcher = self.dispatcher
-        loop = dispatcher.loop or asyncio.get_event_loop()
-
         try:
             results = task.result()
         except Exception as e:
-            loop.create_task(dispatcher.errors_handlers.notify(dispatcher, types.Update.get_current(), e))
+            await dispatcher.errors_handlers.notify(dispatcher, update, e)
         else:
             response = self.get_response(results)
             if response is not None:
-                asyncio.ensure_future(response.execute_response(dispatcher.bot), loop=loop)
+                await response.execute_response(self.bot)
+                await self.response_sent(response)
+
+    @staticmethod
+    async def response_sent(response: BaseResponse) -> None:
+        """
+        Calls ``await response.on_sent()`` if the handler set it, once the response is delivered.
+
+        That is when it was sent through an API request or handed over in the webhook response body.
+        """
+        on_sent = getattr(response, "on_sent", None)
+        if on_sent is not None:
+            await on_sent()
+
+    async def finish(self):
+        """Waits for the handlers that missed the response deadline, call before the invocation returns."""
+        await self.scheduler.drain(self.drain_timeout())
+        for update_id, seconds, in_time, calls in self.scheduler.timings:
+            logging.debug(
+                f"Update {update_id} handled in {seconds * 1000:.0f} ms{'' if in_time else ' (late)'}, "
+                f"{len(calls)} API call(s): {', '.join(calls.methods)}"
+            )
+        if isinstance(self.bot, WebhookBot):
+            logging.debug(f"API connections: {WebhookBot.connection_stats}, reused {WebhookBot.reuse_rate():.0%}")
+
+    def drain_timeout(self) -> float:
+        """Seconds left for the late handlers, WEBHOOK_DRAIN_TIMEOUT or the rest of the function timeout."""
+        if DRAIN_TIMEOUT is not None:
+            return DRAIN_TIMEOUT
+        return max(FUNCTION_TIMEOUT - FLUSH_RESERVE - (time.monotonic() - self.started), 0)
 
     def get_response(self, results):
         """
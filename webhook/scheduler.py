@@ -0,0 +1,154 @@
+import asyncio
+import collections
+import contextvars
+import logging
+import time
+from abc import ABC, abstractmethod
+
+from aiogram import types
+from utils import tracing
+
+
+class ApiCalls(object):
+    """Outbound Bot API requests made while handling one update."""
+
+    __slots__ = ("methods",)
+
+    def __init__(self) -> None:
+        self.methods = []
+
+    def add(self, method: str) -> None:
+        self.methods.append(method)
+
+    def __len__(self):
+        return len(self.methods)
+
+
+# requests of the update handled in the current context, set by DeadlineScheduler.run
+api_calls = contextvars.ContextVar("api_calls", default=None)
+
+
+def update_chat_id(update: types.Update):
+    """Chat (or user) the update belongs to, None if there is none."""
+    message = update.message or update.edited_message or update.channel_post or update.edited_channel_post
+    if message is None and update.callback_query is not None:
+        message = update.callback_query.message
+        if message is None:
+            return update.callback_query.from_user.id
+    if message is not None:
+        return message.chat.id
+    for query in (update.inline_query, update.chosen_inline_result, update.shipping_query, update.pre_checkout_query):
+        if query is not None:
+            return query.from_user.id
+    return None
+
+
+class HandoffSink(ABC):
+    """Takes the updates an invocation could not finish handling, so that they can be handled later."""
+
+    @abstractmethod
+    def put(self, update: types.Update) -> None:
+        """Keeps ``update``, called right before its handler is cancelled."""
+
+
+class MemoryHandoff(HandoffSink):
+    """Keeps the last ``max_size`` handed off updates in the process, until there is a durable queue."""
+
+    def __init__(self, max_size: int = 100) -> None:
+        self.updates = collections.deque(maxlen=max_size)
+
+    def put(self, update: types.Update) -> None:
+        self.updates.append(update)
+
+
+# where the schedulers hand updates off to unless they are given another sink
+handoff_sink = MemoryHandoff()
+
+
+class DeadlineScheduler(object):
+    """
+    Runs update handlers against the webhook response deadline without cancelling them.
+
+    A handler that misses the deadline keeps running in the background and its late callback
+    is called when it finishes. :meth:`drain` waits for these before the invocation returns,
+    the instance may be frozen right after that. Updates still running when :meth:`drain` gives up
+    are handed to :meth:`handoff` and cancelled.
+    """
+
+    def __init__(self, deadline: float, handoff: HandoffSink = None) -> None:
+        self.deadline = deadline
+        self.handoff_sink = handoff if handoff is not None else handoff_sink
+        # (update_id, seconds, finished before the deadline, ApiCalls)
+        self.timings = []
+        # ids of updates that missed the deadline
+        self.overdue = set()
+        # background task -> (update, handler task)
+        self._background = {}
+
+    async def run(self, update: types.Update, coro, on_late):
+        """
+        Runs ``coro`` for ``update`` and returns its result if it finishes before the deadline, None otherwise.
+
+        In the second case ``await on_late(update, task)`` is called once the handler is done.
+        """
+        started = time.perf_counter()
+        # the handlers, the late callback and whatever the caller does with the result count into it
+        calls = ApiCalls()
+        api_calls.set(calls)
+        trace = tracing.start(update.update_id)
+        task = asyncio.ensure_future(coro)
+        try:
+            done, _ = await asyncio.wait({task}, timeout=self.deadline)
+        except asyncio.CancelledError:
+            task.cancel()
+            raise
+
+        if done:
+            self.timings.append((update.update_id, time.perf_counter() - started, True, calls))
+            if trace is not None:
+                trace.finish(in_time=True, api_calls=calls.methods)
+            return task.result()
+
+        self.overdue.add(update.update_id)
+        background = asyncio.ensure_future(self._finish_late(update, task, started, calls, trace, on_late))
+        self._background[background] = (update, task)
+        background.add_done_callback(self._forget)
+        return None
+
+    async def _finish_late(self, update, task, started, calls, trace, on_late):
+        await asyncio.wait({task})
+        self.timings.append((update.update_id, time.perf_counter() - started, False, calls))
+        if trace is not None:
+            trace.finish(in_time=False, api_calls=calls.methods)
+        try:
+            await on_late(update, task)
+        except Exception as e:
+            logging.error(e)
+
+    def _forget(self, background) -> None:
+        self._background.pop(background, None)
+
+    @property
+    def pending(self) -> int:
+        return len(self._background)
+
+    async def drain(self, timeout: float = None) -> None:
+        """
+        Waits up to ``timeout`` seconds (without limit if None) for the handlers that missed the deadline.
+
+        Handlers still running after that are handed off and cancelled.
+        """
+        if not self._background:
+            return
+        _, pending = await asyncio.wait(set(self._background), timeout=timeout)
+        for background in pending:
+            update, task = self._background[background]
+            self.handoff(update)
+            task.cancel()
+            background.cancel()
+
+    def handoff(self, update: types.Update) -> None:
+        """Called for an update that is still being handled when the invocation ends, passes it to the sink."""
+        # the update itself has user names and texts, it does not go to the log
+        logging.error(f"Update {update.update_id} of chat {update_chat_id(update)} was not handled in time")
+        self.handoff_sink.put(update)